@@ -3,10 +3,22 @@ import pandas as pd
 import plotly.graph_objects as go
 import pydeck as pdk
 import os
+import uuid
 import random
+import logging
 from utils.styles import load_css
 from utils.data_loader import COMPANIES, get_company_info, get_financials
 from utils.rag_engine import RAGEngine
+from utils import llm_scheduler, llm_transport
+from utils.index_builder import BackgroundIndexBuilder
+from utils.answer_cache import AnswerCache, SemanticAnswerCache
+from utils.fact_store import FactStore
+
+# Structured RAG logs (index builds, per-question timings) go to the console
+logging.basicConfig(
+    level=os.environ.get("ARGUS_LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s"
+)
 
 # Page Config
 # ... imports ...
@@ -112,6 +124,66 @@ def get_transcript_path(company_name):
     return None
     return None
 
+RAG_EXTRA_DIRS = [os.path.join(os.getcwd(), "transcripts")]
+
+@st.cache_resource(show_spinner=False)
+def get_index_builder(transcripts_dir):
+    # One retrieval index per process, shared by all sessions and providers,
+    # built in the background (transcripts first) so the page never blocks on it,
+    # and rebuilt automatically when files under documents/ or transcripts/ change
+    # (the watcher's baseline is taken before the first build reads the folders)
+    builder = BackgroundIndexBuilder(transcripts_dir, priority_dirs=RAG_EXTRA_DIRS, extra_dirs=RAG_EXTRA_DIRS)
+    return builder.watch().start()
+
+@st.fragment(run_every=2.0)
+def show_index_progress(index_builder, shown_version, shown_done):
+    build = index_builder.snapshot()
+    if build["version"] != shown_version or build["done"] != shown_done:
+        # A new index was swapped in (transcripts -> full corpus, or a reindex) or
+        # a build started or ended: rerun the page to use it
+        st.rerun()
+    if not build["done"]:
+        label = {"priority": "Indexing transcripts", "update": "Updating index with changed files"}.get(build["stage"], "Indexing documents")
+        total = max(build["files_total"], 1)
+        st.progress(min(build["files_done"] / total, 1.0), text=f"{label}: {build['files_done']}/{build['files_total']} files")
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache():
+    # Shared by all sessions; persisted so repeated questions survive restarts
+    cache_dir = os.path.join(os.getcwd(), ".rag_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return AnswerCache(max_entries=512, ttl=24 * 3600, db_path=os.path.join(cache_dir, "answers.sqlite"))
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache():
+    return SemanticAnswerCache(max_entries=256, min_similarity=0.8, min_overlap=0.6)
+
+@st.cache_resource(show_spinner=False)
+def get_fact_store(documents_dir):
+    # Exact figures from the financial schedule workbooks, shared by all sessions;
+    # build() is called on every rerun and only re-extracts when a workbook changed
+    return FactStore(documents_dir)
+
+FACT_PERIODS = {3: "Quarters", 6: "Six months", 9: "Nine months", 12: "Years", 0: "Balance sheet dates"}
+
+LLM_PROVIDERS = ["OpenAI", "Perplexity", "Local"]
+
+def default_api_key(provider):
+    # Load from secrets if available
+    default_key = ""
+    if provider == "Local":
+        # The local stand-in server (local_llm_server.py) accepts any key
+        default_key = "local"
+    try:
+         # Just use provider to check
+        if provider == "Perplexity" and "PERPLEXITY_API_KEY" in st.secrets:
+            default_key = st.secrets["PERPLEXITY_API_KEY"]
+        elif provider == "OpenAI" and "OPENAI_API_KEY" in st.secrets:
+            default_key = st.secrets["OPENAI_API_KEY"]
+    except (FileNotFoundError, KeyError):
+        pass # No secrets file or key
+    return default_key
+
 if page == "Dashboard":
     selected_company = st.sidebar.selectbox("Select Company", ["Overview"] + list(COMPANIES.keys()))
 
@@ -326,21 +398,55 @@ elif page == "AI Analyst":
     
     col_p1, col_p2 = st.columns(2)
     with col_p1:
-        provider = st.selectbox("Select Intelligence Provider", ["OpenAI", "Perplexity"], index=1)
+        provider = st.selectbox("Select Intelligence Provider", LLM_PROVIDERS, index=1)
     with col_p2:
-        # Load from secrets if available
-        default_key = ""
-        try:
-             # Just use provider to check
-            if provider == "Perplexity" and "PERPLEXITY_API_KEY" in st.secrets:
-                default_key = st.secrets["PERPLEXITY_API_KEY"]
-            elif provider == "OpenAI" and "OPENAI_API_KEY" in st.secrets:
-                default_key = st.secrets["OPENAI_API_KEY"]
-        except (FileNotFoundError, KeyError):
-            pass # No secrets file or key
-            
-        api_key = st.text_input(f"{provider} API Key", value=default_key, type="password")
-    
+        api_key = st.text_input(f"{provider} API Key", value=default_api_key(provider), type="password")
+
+    # Hedged mode: slow answers are also requested from a backup provider
+    hedge_provider, hedge_key = None, None
+    with st.expander("Hedged Requests"):
+        if st.checkbox("Also ask a backup provider when the answer is slow to start"):
+            col_h1, col_h2 = st.columns(2)
+            with col_h1:
+                hedge_provider = st.selectbox("Backup Provider", [p for p in LLM_PROVIDERS if p != provider])
+            with col_h2:
+                hedge_key = st.text_input(f"{hedge_provider} API Key", value=default_api_key(hedge_provider), type="password")
+            st.caption("The backup request is sent once the primary provider is slower than 90% of its recent answers; "
+                       "the first answer to start streaming is shown and the other request is cancelled.")
+            if not hedge_key:
+                hedge_provider = None
+
+    # Exact reported figures, straight from the financial schedule workbooks (no LLM needed)
+    with st.expander("KPI Facts"):
+        fact_store = get_fact_store(os.path.join(os.getcwd(), "documents"))
+        fact_status = fact_store.build()
+        fact_metrics = sorted(fact_store.metrics())
+        if not fact_metrics:
+            st.info(fact_status if not fact_store.is_ready else "No financial schedule workbooks found in documents/.")
+        else:
+            col_f1, col_f2 = st.columns(2)
+            with col_f1:
+                default_metric = "organic_sales_growth"
+                fact_metric = st.selectbox("Metric", fact_metrics,
+                                           index=fact_metrics.index(default_metric) if default_metric in fact_metrics else 0)
+            all_facts = fact_store.query(fact_metric, segment=None, all_versions=True)
+            with col_f2:
+                segments = sorted(all_facts["segment"].unique(), key=lambda s: (s != "Total", s))
+                fact_segment = st.selectbox("Segment", segments)
+            months = sorted(all_facts.loc[all_facts["segment"] == fact_segment, "months"].unique(), key=lambda m: (m == 0, m))
+            col_f3, col_f4 = st.columns(2)
+            with col_f3:
+                fact_months = st.selectbox("Periods", months, format_func=lambda m: FACT_PERIODS.get(m, f"{m} months"))
+            with col_f4:
+                fact_last = st.slider("Most recent", min_value=1, max_value=20, value=8)
+            facts = fact_store.query(fact_metric, segment=fact_segment, months=fact_months, last=fact_last)
+            st.dataframe(facts[["period", "segment", "value", "unit", "line_item", "source", "restated"]],
+                         hide_index=True, use_container_width=True)
+            if len(facts) > 1:
+                st.line_chart(facts.set_index("period")["value"])
+            st.caption("Each period is taken from the latest workbook reporting it. Restated figures differ from what was "
+                       "first published; periods from before a restatement that were never re-reported are not shown.")
+
     if not api_key:
         st.warning(f"Please enter your {provider} API Key to proceed.")
         st.caption("Perplexity Pro users can generate API keys at settings.perplexity.ai")
@@ -349,42 +455,123 @@ elif page == "AI Analyst":
     elif provider == "Perplexity" and api_key.startswith("sk-") and not api_key.startswith("sk-or-"):
         st.warning("You selected 'Perplexity' but this looks like an OpenAI Key. Please check your selection.")
     else:
-        # Check if engine needs re-initialization (if provider or key changed)
-        if 'rag_engine' not in st.session_state or \
-           st.session_state.get('rag_provider') != provider or \
-           st.session_state.get('rag_key') != api_key:
+        transcripts_dir = os.path.join(os.getcwd(), "documents")
+        with st.spinner("Initializing AI Engine with Local Embeddings..."):
+            index_builder = get_index_builder(transcripts_dir)
+        build = index_builder.snapshot()
+        rag_index, status = build["index"], build["status"]
+        show_index_progress(index_builder, build["version"], build["done"])
+
+        if rag_index is None:
+            if build["done"]:
+                st.error(status)
+            else:
+                st.info("Building the knowledge base index in the background. The chat opens as soon as the transcripts are indexed.")
+        else:
+            # Check if engine needs re-initialization (if provider, key or index changed).
+            # The engine is only a thin client handle, the index itself is shared.
+            if 'rag_engine' not in st.session_state or \
+               st.session_state.get('rag_provider') != provider or \
+               st.session_state.get('rag_key') != api_key or \
+               st.session_state.get('rag_hedge') != (hedge_provider, hedge_key) or \
+               st.session_state['rag_engine'].index is not rag_index:
             
-            with st.spinner(f"Initializing AI Engine with {provider} and Local Embeddings..."):
-                transcripts_dir = os.path.join(os.getcwd(), "documents")
-                rag = RAGEngine(transcripts_dir, api_key, provider=provider)
-                status = rag.process_documents()
+                rag = RAGEngine(transcripts_dir, api_key, provider=provider, index=rag_index,
+                                answer_cache=get_answer_cache(), semantic_cache=get_semantic_cache(),
+                                hedge_provider=hedge_provider, hedge_api_key=hedge_key,
+                                session_id=st.session_state.setdefault('rag_session_id', uuid.uuid4().hex))
                 st.session_state['rag_engine'] = rag
                 st.session_state['rag_provider'] = provider
                 st.session_state['rag_key'] = api_key
+                st.session_state['rag_hedge'] = (hedge_provider, hedge_key)
                 if "Successfully" in status:
                     st.success(status)
                 else:
                     st.error(status)
+
+            partial_note = "Partial corpus: answered from the transcripts only, the remaining documents are still being indexed."
+            if build["partial"]:
+                st.info(partial_note)
         
-        # Chat Interface
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
-
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-
-        if prompt := st.chat_input("Ask about supply chain impacts..."):
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(prompt)
-
-            with st.chat_message("assistant"):
-                with st.spinner("Analyzing Transcripts..."):
-                    response = st.session_state['rag_engine'].answer_question(prompt)
-                    st.markdown(response)
-            
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            # Optional retrieval filters (company / fiscal year / document type)
+            rag_filters = {}
+            auto_facets = False
+            if rag_index.facets is not None:
+                with st.expander("Search Filters"):
+                    col_f1, col_f2, col_f3 = st.columns(3)
+                    with col_f1:
+                        companies = st.multiselect("Company", rag_index.facets.values("company"))
+                    with col_f2:
+                        years = st.multiselect("Fiscal Year", rag_index.facets.values("year"))
+                    with col_f3:
+                        doc_types = st.multiselect(
+                            "Document Type", rag_index.facets.values("doc_type"),
+                            format_func=lambda t: t.replace("_", " ").title()
+                        )
+                    auto_facets = st.checkbox("Detect filters from the question (e.g. \"KMB Q3 2025 transcripts\")")
+                for facet, values in [("company", companies), ("year", years), ("doc_type", doc_types)]:
+                    if values:
+                        rag_filters[facet] = values
+            st.session_state['rag_engine'].auto_facets = auto_facets
+
+            # Chat Interface
+            if "messages" not in st.session_state:
+                st.session_state.messages = []
+
+            for message in st.session_state.messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+                    if message.get("partial"):
+                        st.caption(partial_note)
+
+            if prompt := st.chat_input("Ask about supply chain impacts..."):
+                st.session_state.messages.append({"role": "user", "content": prompt})
+                with st.chat_message("user"):
+                    st.markdown(prompt)
+
+                with st.chat_message("assistant"):
+                    # When the provider's rate limit is reached, questions queue (fairly across
+                    # sessions) instead of failing: show the place in the queue meanwhile
+                    queue_status = st.empty()
+
+                    def show_queue_position(position):
+                        if position is None:
+                            queue_status.empty()
+                        elif position:
+                            queue_status.caption(f"Busy: {position} question(s) ahead of yours. Waiting for the {provider} rate limit...")
+                        else:
+                            queue_status.caption(f"Your question is next. Waiting for the {provider} rate limit...")
+
+                    # Tokens are rendered as they arrive; write_stream returns the full text
+                    response = st.write_stream(st.session_state['rag_engine'].answer_question_stream(
+                        prompt, rag_filters, on_queue=show_queue_position
+                    ))
+                    if build["partial"]:
+                        st.caption(partial_note)
+
+                st.session_state.messages.append({"role": "assistant", "content": response, "partial": build["partial"]})
+
+            cache_stats = get_answer_cache().stats()
+            semantic_stats = get_semantic_cache().stats()
+            st.caption(
+                f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['size']} cached) · "
+                f"Similar-question cache: {semantic_stats['hits']} hits / {semantic_stats['misses']} misses"
+            )
+
+            with st.expander("Debug: stage timings"):
+                st.markdown("**Last question**")
+                if st.session_state['rag_engine'].last_metrics:
+                    st.json(st.session_state['rag_engine'].last_metrics)
+                else:
+                    st.caption("Ask a question to see its timings.")
+                st.markdown("**Index build**")
+                st.json(rag_index.last_metrics or {})
+                st.markdown("**LLM calls (all sessions)**")
+                st.json(llm_transport.stats.stats())
+                st.markdown("**Provider latency**")
+                st.json(llm_transport.latency_report())
+                st.markdown("**Rate limit queues**")
+                st.json(llm_scheduler.scheduler_stats())
 
 elif page == "Supply Chain":
     st.title("Supply Chain Network Optimization")
@@ -0,0 +1,85 @@
+"""Runs a list of questions against the document index and writes a report.
+
+Usage:
+    python batch_questions.py questions.txt --provider Perplexity --output report.md
+
+The questions file has one question per line (blank lines and lines starting
+with '#' are ignored). The API key is read from --api-key or from the
+OPENAI_API_KEY / PERPLEXITY_API_KEY environment variables. The Local provider
+(see local_llm_server.py) needs no key.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from utils.rag_engine import RAGEngine
+
+API_KEY_ENV = {"OpenAI": "OPENAI_API_KEY", "Perplexity": "PERPLEXITY_API_KEY", "Local": "LOCAL_LLM_API_KEY"}
+
+
+def read_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def write_report(path, provider, model_name, questions, answers, elapsed):
+    if path.lower().endswith(".json"):
+        report = {
+            "provider": provider,
+            "model": model_name,
+            "elapsed_seconds": round(elapsed, 2),
+            "results": [{"question": q, "answer": a} for q, a in zip(questions, answers)],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Strategic Questions Report\n\n")
+        f.write(f"- Provider: {provider} ({model_name})\n")
+        f.write(f"- Generated: {time.strftime('%Y-%m-%d %H:%M')}\n")
+        f.write(f"- Questions: {len(questions)} in {elapsed:.1f}s\n\n")
+        for i, (question, answer) in enumerate(zip(questions, answers), 1):
+            f.write(f"## {i}. {question}\n\n{answer}\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions against the knowledge base.")
+    parser.add_argument("questions", help="Text file with one question per line")
+    parser.add_argument("--provider", choices=sorted(API_KEY_ENV), default="OpenAI")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--documents", default="documents", help="Documents folder to index")
+    parser.add_argument("--output", default="report.md", help="Report path (.md or .json)")
+    parser.add_argument("--concurrency", type=int, default=5, help="Max LLM requests in flight")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level, INFO shows per-question timings")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    api_key = args.api_key or os.environ.get(API_KEY_ENV[args.provider])
+    if not api_key and args.provider == "Local":
+        api_key = "local"  # the stand-in server accepts any key
+    if not api_key:
+        sys.exit(f"No API key: pass --api-key or set {API_KEY_ENV[args.provider]}.")
+
+    questions = read_questions(args.questions)
+    if not questions:
+        sys.exit(f"No questions found in {args.questions}.")
+
+    rag = RAGEngine(args.documents, api_key, provider=args.provider, extra_dirs=["transcripts"])
+    print(rag.process_documents())
+
+    start = time.time()
+    answers = rag.answer_many(questions, max_concurrency=args.concurrency, timeout=args.timeout)
+    elapsed = time.time() - start
+
+    write_report(args.output, args.provider, rag.model_name, questions, answers, elapsed)
+    failed = sum(answer.startswith("Error answering question") for answer in answers)
+    print(f"Answered {len(questions) - failed}/{len(questions)} questions in {elapsed:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Benchmarks index build time, memory, index size, retrieval latency and recall.
+
+Usage:
+    python benchmark_rag.py --output bench.json
+    python benchmark_rag.py --chunk-size 800 --overlap 150 --retriever bm25 --skip-cold
+
+Each phase runs in a fresh process so its peak RSS is its own:
+  - cold: process_documents() into an empty cache (every file is extracted)
+  - warm: process_documents() from that cache, then retrieval latency and
+    recall@k over the labeled questions in data/rag_benchmark_questions.json
+
+Retrieval latency is the time answer_question spends before calling the LLM
+(facet selection, search, context packing), measured with the caches off.
+Results are printed (or written with --output) as JSON, to compare commits.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+import numpy as np
+from utils.rag_engine import RAGEngine
+from utils.rag_index import DocumentIndex
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_QUESTIONS = os.path.join("data", "rag_benchmark_questions.json")
+DEFAULT_KS = (1, 3, 5, 10)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (PDF worker processes not included)."""
+    # VmHWM is reset by exec; ru_maxrss is not, so a spawned process would report its parent's peak
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) * 1024 / 1e6, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+    }
+
+
+def make_index(options):
+    index = DocumentIndex(
+        options["documents"],
+        cache_dir=options["cache_dir"],
+        retriever=options["retriever"],
+        extra_dirs=options["extra_dirs"],
+        dedup=options["dedup"],
+        compact=options["compact"],
+    )
+    index.chunk_size = options["chunk_size"]
+    index.overlap = options["overlap"]
+    return index
+
+
+def index_size(index):
+    """On-disk size of the index cache entry, per file and in total (bytes)."""
+    entry_dir = os.path.join(index.cache.version_dir, index.index_key)
+    files = {}
+    if os.path.isdir(entry_dir):
+        for name in sorted(os.listdir(entry_dir)):
+            files[name] = os.path.getsize(os.path.join(entry_dir, name))
+    segments = 0
+    if os.path.isdir(index.cache.segments_dir):
+        segments = sum(entry.stat().st_size for entry in os.scandir(index.cache.segments_dir))
+    return {"total_bytes": sum(files.values()), "files": files, "segments_bytes": segments}
+
+
+def index_memory(index):
+    """Bytes held by the arrays a query touches (mapped or in memory)."""
+    arrays = [
+        index.tfidf_matrix.data, index.tfidf_matrix.indices, index.tfidf_matrix.indptr, index.vectorizer.idf_,
+        index.chunks.doc_ids, index.chunks.starts, index.chunks.ends,
+    ]
+    retriever = index.retriever
+    if index.retriever_name == "bm25":
+        arrays += [retriever.indptr, retriever.chunk_ids, retriever.term_freqs, retriever.length_norm]
+    return int(sum(array.nbytes for array in arrays))
+
+
+def recall_at_k(index, questions, ks):
+    """Share of questions with a labeled source file among the top-k retrieved chunks, per k."""
+    found = {k: 0 for k in ks}
+    misses = []
+    for item in questions:
+        expected = set(item["sources"])
+        sources = [index.chunks.source(i) for i, _ in index.search(item["question"], max(ks))]
+        for k in ks:
+            if expected & set(sources[:k]):
+                found[k] += 1
+        if not expected & set(sources[:max(ks)]):
+            misses.append(item["question"])
+    recall = {f"recall@{k}": round(found[k] / len(questions), 3) for k in ks}
+    return recall, misses
+
+
+def run_phase(phase, options):
+    index = make_index(options)
+    start = time.perf_counter()
+    status = index.process_documents()
+    result = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "status": status,
+        "documents": index.chunks.num_documents,
+        "chunks": len(index.chunks),
+        "stages": index.last_metrics,
+    }
+    if not index.is_ready:
+        return result
+    if phase == "warm":
+        result.update(measure_queries(index, options))
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["index_size"] = index_size(index)
+    return result
+
+
+def measure_queries(index, options):
+    with open(options["questions"], "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    queries = [item["question"] for item in questions]
+
+    # Caches off: every call does the full retrieval path of answer_question
+    engine = RAGEngine(options["documents"], "benchmark", provider="Local", index=index)
+    for query in queries:  # warm up page cache and lazy structures
+        engine._prepare(query)
+
+    search_ms, prepare_ms = [], []
+    for _ in range(options["repeat"]):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, engine.candidate_pool)
+            search_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            engine._prepare(query)
+            prepare_ms.append((time.perf_counter() - start) * 1000)
+
+    recall, misses = recall_at_k(index, questions, options["ks"])
+    # Top chunk ids per question, to check that a representation change keeps the ranking
+    rankings = [[i for i, _ in index.search(query, max(options["ks"]))] for query in queries]
+    # Whether a labeled source survives context packing, i.e. actually reaches the LLM
+    in_context = 0
+    for item in questions:
+        _, request = engine._prepare(item["question"])
+        if set(item["sources"]) & {index.chunks.source(i) for i in request["chunk_ids"]}:
+            in_context += 1
+
+    return {
+        "questions": len(questions),
+        "search_latency": percentiles(search_ms),
+        "retrieval_latency": percentiles(prepare_ms),
+        "recall": recall,
+        "context_recall": round(in_context / len(questions), 3),
+        "missed_questions": misses,
+        "rankings": rankings,
+        "memory_bytes": index_memory(index),
+    }
+
+
+def _phase_worker(phase, options, queue):
+    try:
+        queue.put(run_phase(phase, options))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_in_process(phase, options):
+    """Runs one phase in a fresh (non-daemon, so it may start PDF workers) process."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_phase_worker, args=(phase, options, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG index and retrieval.")
+    parser.add_argument("--documents", default="documents", help="Documents folder to index")
+    parser.add_argument("--no-transcripts", action="store_true", help="Don't index transcripts/ alongside")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Labeled question -> source file pairs")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--retriever", choices=["tfidf", "bm25"], default="tfidf")
+    parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate documents and passages")
+    parser.add_argument("--no-compact", action="store_true", help="float64 index instead of float32")
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_KS), help="Cutoffs for recall@k")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed passes over the questions")
+    parser.add_argument("--cache-dir", default=None, help="Index cache to use (default: a temporary one)")
+    parser.add_argument("--skip-cold", action="store_true", help="Only run the warm phase (needs a populated --cache-dir)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="rag_bench_")
+    options = {
+        "documents": args.documents,
+        "extra_dirs": [] if args.no_transcripts else ["transcripts"],
+        "questions": args.questions,
+        "chunk_size": args.chunk_size,
+        "overlap": args.overlap,
+        "retriever": args.retriever,
+        "dedup": not args.no_dedup,
+        "compact": not args.no_compact,
+        "ks": sorted(set(args.k)),
+        "repeat": args.repeat,
+        "cache_dir": cache_dir,
+    }
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {key: options[key] for key in ("chunk_size", "overlap", "retriever", "dedup", "compact", "ks", "repeat", "extra_dirs")},
+    }
+    try:
+        if not args.skip_cold:
+            report["cold"] = run_in_process("cold", options)
+        report["warm"] = run_in_process("warm", options)
+    finally:
+        if args.cache_dir is None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Builds the financial fact table from the xlsx schedules and queries it.
+
+Usage:
+    python financial_facts.py "organic sales growth" --months 3 --last 8
+    python financial_facts.py "operating profit" --segment NA --start 2024-01-01
+    python financial_facts.py --list earnings share
+
+The table (see utils/fact_store.py) is cached as Parquet under the cache
+directory and only rebuilt when a workbook changes. Metric names are
+case- and punctuation-insensitive; --list shows the ones containing the
+given words. Periods on a superseded basis (before a restatement, never
+re-reported) are left out unless --mixed-basis is given.
+"""
+import sys
+import time
+import logging
+import argparse
+import pandas as pd
+from utils.fact_store import FactStore
+
+DISPLAY_COLUMNS = ["period", "segment", "value", "unit", "line_item", "source", "restated"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query exact figures from the financial schedule workbooks.")
+    parser.add_argument("metric", nargs="*", help="Metric to query, e.g. \"net sales\"")
+    parser.add_argument("--list", action="store_true", help="List the metrics containing the given words instead")
+    parser.add_argument("--segment", default="Total", help="Business segment, e.g. NA or IPC (default: Total)")
+    parser.add_argument("--months", type=int, default=None, help="Period length: 3 quarters, 12 years, 0 balance sheet dates")
+    parser.add_argument("--start", default=None, help="First period end date (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last period end date (YYYY-MM-DD)")
+    parser.add_argument("--last", type=int, default=None, help="Only the most recent N periods")
+    parser.add_argument("--all-versions", action="store_true", help="Every reported value, not only the latest")
+    parser.add_argument("--mixed-basis", action="store_true",
+                        help="Keep periods from before a restatement that were never re-reported on the new basis")
+    parser.add_argument("--documents", default="documents", help="Documents folder with the workbooks")
+    parser.add_argument("--cache-dir", default=None, help="Where the Parquet table is kept (default: .rag_cache)")
+    parser.add_argument("--csv", action="store_true", help="Print CSV instead of a table")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level, INFO shows build timings")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    store = FactStore(args.documents, cache_dir=args.cache_dir)
+    status = store.build()
+    if not store.is_ready:
+        print(status, file=sys.stderr)
+        return 1
+    print(status, file=sys.stderr)
+
+    text = " ".join(args.metric)
+    if args.list or not text:
+        counts = store.metrics()
+        for metric in (store.find_metrics(text) if text else sorted(counts)):
+            print(f"{metric} ({counts[metric]})")
+        return 0
+
+    started = time.perf_counter()
+    facts = store.query(text, segment=args.segment, months=args.months, start=args.start, end=args.end,
+                        last=args.last, all_versions=args.all_versions, mixed_basis=args.mixed_basis)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if facts.empty:
+        suggestions = store.find_metrics(text)[:10]
+        print(f"No facts for {store.resolve(text)!r}." + (f" Similar metrics: {', '.join(suggestions)}" if suggestions else ""),
+              file=sys.stderr)
+        return 1
+    if args.csv:
+        facts.to_csv(sys.stdout, index=False)
+    else:
+        with pd.option_context("display.width", 200, "display.max_colwidth", 80):
+            print(facts[DISPLAY_COLUMNS].to_string(index=False))
+    print(f"{len(facts)} facts in {elapsed_ms:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Local stand-in for the OpenAI chat completions API, for offline benchmarks and tests.
+
+Usage:
+    python local_llm_server.py --port 8765 --latency 0.5 --tokens-per-second 40
+
+Then pick the "Local" provider (RAGEngine(..., provider="Local")). The server
+answers POST /v1/chat/completions, streamed or not, with a deterministic
+answer built from the question and the sources in the prompt context. It waits
+`latency` seconds before the first token and then emits `tokens_per_second`
+tokens, so the end-to-end latency and throughput of the pipeline can be
+measured without network access or API keys. `--fail-rate` answers that share
+of requests with an error status instead (429 by default), to exercise retries.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MODEL_NAME = "local-echo"
+CHARS_PER_TOKEN = 4
+
+
+def _last_user_message(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+
+def echo_answer(messages, answer_tokens=64):
+    """The deterministic answer for a chat: the question, its sources, then filler words."""
+    prompt = _last_user_message(messages)
+    match = re.search(r"Question:\s*(.*)\s*$", prompt, re.S)
+    question = match.group(1).strip() if match else prompt.strip()
+    sources = list(dict.fromkeys(re.findall(r"^Source: (.+)$", prompt, re.M)))
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+
+    words = f"[{MODEL_NAME} {digest}] Answer to: {question}".split()
+    if sources:
+        words += ["Sources:"] + "; ".join(sources).split()
+    filler = "This is a deterministic placeholder answer from the local stand-in model.".split()
+    while len(words) < answer_tokens:
+        words += filler
+    return words[:max(answer_tokens, 1)]
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": MODEL_NAME, "object": "model", "owned_by": "local"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request["messages"]
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": {"message": f"Bad request: {e}", "type": "invalid_request_error"}})
+            return
+        if random.random() < self.server.fail_rate:
+            self._send_json(self.server.fail_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        words = echo_answer(messages, self.server.answer_tokens)
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        usage = {
+            "prompt_tokens": prompt_chars // CHARS_PER_TOKEN,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_chars // CHARS_PER_TOKEN + len(words),
+        }
+        completion_id = f"chatcmpl-local-{time.time_ns()}"
+        model = request.get("model") or MODEL_NAME
+        token_delay = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second > 0 else 0.0
+
+        time.sleep(self.server.latency)
+        if request.get("stream"):
+            self._stream(completion_id, model, words, token_delay)
+            return
+
+        time.sleep(token_delay * len(words))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id, model, words, token_delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                event({"content": word if i == 0 else " " + word})
+                time.sleep(token_delay)
+            event({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the stream
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, latency=0.0, tokens_per_second=0.0,
+                answer_tokens=64, verbose=False, fail_rate=0.0, fail_status=429):
+    """Creates (but does not start) the stand-in server; port 0 picks a free port.
+
+    Run it with serve_forever(), e.g. in a daemon thread for in-process benchmarks.
+    `tokens_per_second` <= 0 sends the whole answer at once. A `fail_rate`
+    share of requests gets a `fail_status` error response.
+    """
+    server = ThreadingHTTPServer((host, port), ChatCompletionsHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.tokens_per_second = tokens_per_second
+    server.answer_tokens = answer_tokens
+    server.verbose = verbose
+    server.fail_rate = fail_rate
+    server.fail_status = fail_status
+    return server
+
+
+def server_url(server):
+    """The base_url to give an OpenAI client for a running server."""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in LLM server.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation rate (0 = instant)")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Tokens per answer")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--fail-status", type=int, default=429, help="HTTP status of injected errors")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.tokens_per_second, args.answer_tokens, args.verbose,
+                         args.fail_rate, args.fail_status)
+    print(f"Local LLM stand-in listening on {server_url(server)} (model {MODEL_NAME})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from scipy import sparse
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Case, whitespace and trailing punctuation don't change what is being asked."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def filters_key(filters):
+    """Canonical string for retrieval filters, so equal filters share cache entries."""
+    if not filters:
+        return ""
+    canonical = {
+        facet: sorted(values if isinstance(values, (list, tuple, set)) else [values])
+        for facet, values in filters.items()
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+
+def make_key(query, provider, model_name, index_version, filters=None):
+    raw = "\0".join([normalize_query(query), provider, model_name, index_version or "", filters_key(filters)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Exact-match answer cache with a TTL and a size-bounded LRU.
+
+    Entries are keyed by (normalized query, provider, model, index version), so
+    an answer is never served across providers or for a different corpus. With
+    `db_path`, entries are also written to SQLite and survive restarts. Safe to
+    share between sessions (threads).
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (created, answer)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, created REAL, answer TEXT)"
+            )
+            if ttl is not None:
+                self.db.execute("DELETE FROM answers WHERE created < ?", (time.time() - ttl,))
+            self.db.commit()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Returns the cached answer or None, counting a hit or a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute("SELECT created, answer FROM answers WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, answer):
+        entry = (time.time(), answer)
+        with self.lock:
+            self._remember(key, entry)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO answers (key, created, answer) VALUES (?, ?, ?)", (key, *entry)
+                )
+                self.db.commit()
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _forget(self, key):
+        self.entries.pop(key, None)
+        if self.db is not None:
+            self.db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM answers")
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+            }
+
+
+class SemanticAnswerCache:
+    """Second cache tier for paraphrased questions.
+
+    Keeps the TF-IDF vectors of recently answered queries (from the index's own
+    vectorizer) in a small sparse matrix. A new query reuses an answer when its
+    cosine similarity to a prior query and the Jaccard overlap of their
+    retrieved chunk ids both reach the thresholds, and both were asked under the
+    same scope (provider, model, index version, filters).
+    """
+
+    def __init__(self, max_entries=128, min_similarity=0.8, min_overlap=0.6, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.min_overlap = min_overlap
+        self.ttl = ttl
+        self.entries = []  # (created, scope, chunk_ids, answer), oldest first
+        self.vectors = None  # one l2-normalized row per entry
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, query_vec, chunk_ids, scope):
+        """Returns a cached answer for a near-duplicate query, or None."""
+        chunk_ids = frozenset(chunk_ids)
+        with self.lock:
+            if self.entries:
+                similarities = (self.vectors @ query_vec.T).toarray().ravel()
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.min_similarity:
+                        break
+                    created, entry_scope, entry_ids, answer = self.entries[i]
+                    if entry_scope != scope or (self.ttl is not None and time.time() - created > self.ttl):
+                        continue
+                    union = len(chunk_ids | entry_ids)
+                    if union and len(chunk_ids & entry_ids) / union >= self.min_overlap:
+                        self.hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def put(self, query_vec, chunk_ids, scope, answer):
+        with self.lock:
+            self.entries.append((time.time(), scope, frozenset(chunk_ids), answer))
+            rows = [query_vec] if self.vectors is None else [self.vectors, query_vec]
+            self.vectors = sparse.vstack(rows).tocsr()
+            overflow = len(self.entries) - self.max_entries
+            if overflow > 0:
+                self.entries = self.entries[overflow:]
+                self.vectors = self.vectors[overflow:]
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+            self.vectors = None
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+            }
@@ -0,0 +1,124 @@
+import numpy as np
+from utils.spreadsheet import is_spreadsheet
+
+
+def chunk_offsets(length, chunk_size, overlap):
+    """Start/end character offsets of the sliding windows over a text of `length` chars."""
+    starts = np.arange(0, length, chunk_size - overlap, dtype=np.int32)
+    ends = np.minimum(starts + chunk_size, length).astype(np.int32)
+    return starts, ends
+
+
+def row_chunk_offsets(text, chunk_size):
+    """Start/end character offsets of chunks made of whole lines, up to `chunk_size` chars each.
+
+    Used for serialized spreadsheets, where every line is one table row with
+    its own provenance: a chunk never cuts a row in half, so no overlap is
+    needed. A line longer than `chunk_size` is split into windows of its own.
+    """
+    starts, ends = [], []
+    start = end = 0
+    for line_end in _line_ends(text):
+        if line_end - start > chunk_size and end > start:
+            starts.append(start)
+            ends.append(end)
+            start = end
+        while line_end - start > chunk_size:
+            starts.append(start)
+            ends.append(start + chunk_size)
+            start += chunk_size
+        end = line_end
+    if end > start:
+        starts.append(start)
+        ends.append(end)
+    return np.array(starts, dtype=np.int32), np.array(ends, dtype=np.int32)
+
+
+def _line_ends(text):
+    position = text.find("\n")
+    while position != -1:
+        yield position + 1
+        position = text.find("\n", position + 1)
+    if not text.endswith("\n") and text:
+        yield len(text)
+
+
+def document_chunk_offsets(filename, text, chunk_size, overlap):
+    """Chunk offsets for one document: row-aligned for spreadsheets, sliding windows otherwise."""
+    if is_spreadsheet(filename):
+        return row_chunk_offsets(text, chunk_size)
+    return chunk_offsets(len(text), chunk_size, overlap)
+
+
+def _byte_offsets(text, char_offsets):
+    """Maps character offsets into `text` to offsets into its UTF-8 encoding."""
+    if text.isascii():
+        return np.asarray(char_offsets, dtype=np.int64)
+    points = np.unique(np.concatenate([[0], char_offsets]))
+    sizes = [len(text[a:b].encode("utf-8")) for a, b in zip(points[:-1], points[1:])]
+    byte_points = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    return byte_points[np.searchsorted(points, char_offsets)]
+
+
+class ChunkStore:
+    """Document texts kept once, with chunks as (doc_id, start, end) integer arrays.
+
+    All documents live in a single UTF-8 buffer (`corpus`, a uint8 array that may
+    be a read-only memmap shared between processes), and chunk offsets are byte
+    offsets into it. Chunk strings are only materialized on demand, e.g. for the
+    top-k hits of a query, instead of holding every overlapping window as its
+    own string.
+    """
+
+    def __init__(self, filenames, corpus, doc_ids, starts, ends):
+        self.filenames = list(filenames)
+        self.corpus = corpus
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    @classmethod
+    def from_texts(cls, filenames, texts, chunk_size, overlap):
+        empty = np.empty(0, dtype=np.int64)
+        doc_ids, starts, ends = [empty.astype(np.int32)], [empty], [empty]
+        encoded = []
+        position = 0
+        for doc_id, (filename, text) in enumerate(zip(filenames, texts)):
+            doc_starts, doc_ends = document_chunk_offsets(filename, text, chunk_size, overlap)
+            doc_ids.append(np.full(len(doc_starts), doc_id, dtype=np.int32))
+            starts.append(position + _byte_offsets(text, doc_starts))
+            ends.append(position + _byte_offsets(text, doc_ends))
+            data = text.encode("utf-8")
+            encoded.append(data)
+            position += len(data)
+        corpus = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(filenames, corpus, np.concatenate(doc_ids), np.concatenate(starts), np.concatenate(ends))
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty(0, dtype=np.uint8), [], [], [])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def num_documents(self):
+        return len(self.filenames)
+
+    def source(self, i):
+        return self.filenames[self.doc_ids[i]]
+
+    def span_text(self, start, end):
+        """Text between two byte offsets of the corpus."""
+        return self.corpus[start:end].tobytes().decode("utf-8", errors="replace")
+
+    def text(self, i):
+        return self.span_text(self.starts[i], self.ends[i])
+
+    def format(self, i):
+        """The chunk as it is shown to the LLM, prefixed with its source file."""
+        return f"Source: {self.source(i)}\n\n{self.text(i)}"
+
+    def format_span(self, doc_id, start, end):
+        """Like format(), for an arbitrary byte span inside one document, e.g. merged chunks."""
+        return f"Source: {self.filenames[doc_id]}\n\n{self.span_text(start, end)}"
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Prompt tokens reserved for retrieved context, per model. The old fixed top-5
+# of 1000-char chunks sent roughly 1250 tokens, overlaps and duplicates included.
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 1000,
+    "sonar-pro": 1200,
+    "local-echo": 1000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1000
+CHARS_PER_TOKEN = 4  # rough average for English prose; avoids a tokenizer dependency
+
+
+def estimate_tokens(num_chars):
+    return int(np.ceil(num_chars / CHARS_PER_TOKEN))
+
+
+def context_budget(model_name):
+    return CONTEXT_TOKEN_BUDGETS.get(model_name, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def merge_spans(chunks, chunk_ids):
+    """Merges chunks that overlap or touch within a document into (doc_id, start, end) spans.
+
+    Spans are returned in the order of the best-ranked chunk they contain.
+    """
+    by_doc = {}
+    for rank, i in enumerate(chunk_ids):
+        by_doc.setdefault(int(chunks.doc_ids[i]), []).append((int(chunks.starts[i]), int(chunks.ends[i]), rank))
+    spans = []
+    for doc_id, parts in by_doc.items():
+        parts.sort()
+        start, end, best = parts[0]
+        for part_start, part_end, rank in parts[1:]:
+            if part_start <= end:
+                end = max(end, part_end)
+                best = min(best, rank)
+            else:
+                spans.append((best, doc_id, start, end))
+                start, end, best = part_start, part_end, rank
+        spans.append((best, doc_id, start, end))
+    spans.sort()
+    return [(doc_id, start, end) for _, doc_id, start, end in spans]
+
+
+def _spans_chars(spans):
+    # byte lengths are a close enough stand-in for character counts here
+    return sum(end - start for _, start, end in spans)
+
+
+def pack_context(chunks, tfidf_matrix, hits, token_budget, mmr_lambda=0.7, duplicate_threshold=0.9):
+    """Picks and merges retrieved chunks into context spans that fit a token budget.
+
+    `hits` is the retriever's [(chunk_index, score), ...] candidate pool, best first.
+    Candidates are ordered by maximal marginal relevance (relevance traded off
+    against cosine similarity to what is already selected), candidates nearly
+    identical to a selected chunk (e.g. the same deck filed under several
+    names) are dropped, and overlapping or adjacent windows are merged so
+    their shared text is sent once. Chunks are added until the next one would
+    exceed the budget.
+
+    Returns (spans, chunk_ids): merged (doc_id, start, end) byte spans, best
+    first, and the chunk indices they were built from.
+    """
+    if not hits:
+        return [], []
+    candidates = np.array([i for i, _ in hits])
+    scores = np.array([score for _, score in hits], dtype=np.float64)
+    relevance = scores / scores.max() if scores.max() > 0 else np.ones_like(scores)
+    vectors = tfidf_matrix[candidates]
+    similarity = (vectors @ vectors.T).toarray()  # rows are l2-normalized
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    selected = []  # positions into candidates
+    remaining = list(range(len(candidates)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        mmr = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        pick = int(np.argmax(mmr))
+        position = remaining.pop(pick)
+        if redundancy[pick] >= duplicate_threshold:
+            continue
+        spans = merge_spans(chunks, candidates[selected + [position]])
+        if _spans_chars(spans) > budget_chars:
+            if not selected:
+                # Always send something: the best chunk, cut to the budget
+                doc_id, start, end = spans[0]
+                return [(doc_id, start, start + budget_chars)], [int(candidates[position])]
+            break
+        selected.append(position)
+
+    chunk_ids = [int(candidates[p]) for p in selected]
+    return merge_spans(chunks, chunk_ids), chunk_ids
@@ -0,0 +1,149 @@
+import re
+import zlib
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows: candidate pairs from Jaccard ~0.5 up
+SHINGLE_WORDS = 5
+WORD_RE = re.compile(r"\w+")
+LINE_RE = re.compile(r"[^\n]*\n|[^\n]+$")
+SENTENCE_END_RE = re.compile(r"[.!?:;\"')\]]\s*$")
+
+# Fixed seed: signatures have to match between builds and processes
+_rng = np.random.RandomState(20240723)
+_PERM_A = _rng.randint(1, 2**62, NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_PERM_B = _rng.randint(0, 2**62, NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+
+def shingle_hashes(text, k=SHINGLE_WORDS):
+    """Unique 64-bit hashes of the k-word shingles of `text` (case-insensitive)."""
+    words = np.array([zlib.crc32(w.encode("utf-8")) for w in WORD_RE.findall(text.lower())], dtype=np.uint64)
+    if len(words) <= k:
+        return np.unique(words)
+    n = len(words) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        # polynomial rolling hash, wrapping mod 2**64
+        hashes = hashes * np.uint64(1000003) + words[j:j + n]
+    return np.unique(hashes)
+
+
+def minhash(shingles):
+    """MinHash signature (NUM_PERM uint64 values) of a shingle set, or None if it is empty."""
+    if len(shingles) == 0:
+        return None
+    return (shingles[:, None] * _PERM_A + _PERM_B).min(axis=0)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the sets behind two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+
+class MinHashLSH:
+    """Banded LSH over MinHash signatures: finds an earlier near-duplicate without comparing every pair."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = []
+
+    def _bands(self, signature):
+        for band in range(BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def match(self, signature):
+        """Index of the first stored signature at least `threshold` similar, or None."""
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        for i in sorted(candidates):
+            if similarity(signature, self.signatures[i]) >= self.threshold:
+                return i
+        return None
+
+    def add(self, signature):
+        i = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in self._bands(signature):
+            self.buckets[band].setdefault(key, []).append(i)
+        return i
+
+
+def split_passages(text, target_words=40):
+    """Splits text into paragraph-like (start, end) character spans that cover it in order.
+
+    Extracted PDF text has a line break on every visual line and few blank
+    lines, so a passage ends at a blank line, or at the first line ending a
+    sentence once it holds `target_words` words.
+    """
+    spans = []
+    start = 0
+    words = 0
+    for match in LINE_RE.finditer(text):
+        line = match.group()
+        if not line.strip():
+            if words:
+                spans.append((start, match.start()))
+            start, words = match.end(), 0
+            continue
+        words += len(line.split())
+        if words >= target_words and SENTENCE_END_RE.search(line):
+            spans.append((start, match.end()))
+            start, words = match.end(), 0
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def dedup_documents(texts, doc_threshold=0.9, passage_threshold=0.8, min_passage_words=30):
+    """Drops near-duplicate documents and repeated passages, keeping the first occurrence.
+
+    A document whose shingle set is at least `doc_threshold` similar to an
+    earlier document (e.g. the same deck filed under two names) is dropped
+    whole. In the remaining documents, passages of at least `min_passage_words`
+    words that are `passage_threshold` similar to an earlier passage (e.g.
+    forward-looking-statement boilerplate) are cut, so repeated content is
+    indexed once. A document's first passage (its title page) is always kept.
+
+    Returns (texts, duplicate_of, stats): the new texts (None for dropped
+    documents, the very same string when nothing was cut), the index of the
+    document each dropped one duplicates (or None), and counts of what was
+    removed.
+    """
+    documents = MinHashLSH(doc_threshold)
+    passages = MinHashLSH(passage_threshold)
+    results, duplicate_of = [], []
+    stats = {"duplicate_documents": 0, "duplicate_passages": 0, "duplicate_chars": 0}
+    doc_ids = []  # LSH entry -> document index
+
+    for i, text in enumerate(texts):
+        signature = minhash(shingle_hashes(text))
+        if signature is not None:
+            match = documents.match(signature)
+            if match is not None:
+                results.append(None)
+                duplicate_of.append(doc_ids[match])
+                stats["duplicate_documents"] += 1
+                stats["duplicate_chars"] += len(text)
+                continue
+            documents.add(signature)
+            doc_ids.append(i)
+
+        kept = []
+        n = -1
+        for n, (start, end) in enumerate(split_passages(text)):
+            passage = text[start:end]
+            if n and len(passage.split()) >= min_passage_words:
+                passage_signature = minhash(shingle_hashes(passage))
+                if passages.match(passage_signature) is not None:
+                    stats["duplicate_passages"] += 1
+                    stats["duplicate_chars"] += len(passage)
+                    continue
+                passages.add(passage_signature)
+            kept.append(passage)
+        # Unchanged documents keep their exact text (blank lines included), so their counts can be reused
+        results.append(text if len(kept) == n + 1 else "".join(kept))
+        duplicate_of.append(None)
+    return results, duplicate_of, stats
@@ -0,0 +1,208 @@
+import os
+import time
+import logging
+import multiprocessing
+from pypdf import PdfReader
+from utils.spreadsheet import is_spreadsheet, read_xlsx
+
+DEFAULT_EXTRACT_TIMEOUT = 120  # seconds per file
+POLL_SECONDS = 0.2
+
+logger = logging.getLogger("argus.extract")
+
+
+def read_txt(filepath):
+    filename = os.path.basename(filepath)
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    # Basic cleanup for common scraping artifacts (like the ones from Cloudflare)
+    if "<html" in text.lower() and "401 authorization required" in text.lower():
+        logger.warning("Skipping blocked file: %s", filename)
+        text = ""  # Skip this file content
+    elif "<!doctype html>" in text.lower() or "<html" in text.lower():
+        # Very rough heuristic: if it looks like raw HTML and not a transcript summary
+        # we might want to strip tags or just skip if it's junk.
+        # For now, let's just warn and maybe try to start after the <body> tag if simple
+        # or better, just rely on our manually created clean summaries
+        # But specifically for the error user saw:
+        if "challenge-platform" in text or "401 Authorization Required" in text:
+            text = ""
+    return text
+
+
+def read_pdf_pages(filepath):
+    reader = PdfReader(filepath)
+    return [page.extract_text() for page in reader.pages]
+
+
+def read_pdf(filepath):
+    return "".join(page + "\n" for page in read_pdf_pages(filepath))
+
+
+def extract_text_pages(filepath):
+    """Returns (text, page count) of a supported document.
+
+    Text files count as no pages and workbooks count their sheets as pages.
+    """
+    lower = filepath.lower()
+    if lower.endswith(".txt"):
+        return read_txt(filepath), 0
+    if lower.endswith(".pdf"):
+        pages = read_pdf_pages(filepath)
+        return "".join(page + "\n" for page in pages), len(pages)
+    if is_spreadsheet(filepath):
+        return read_xlsx(filepath)
+    return "", 0
+
+
+def extract_text(filepath):
+    """Returns the plain text of a supported document, or "" for unknown types."""
+    return extract_text_pages(filepath)[0]
+
+
+def _safe_extract(filepath):
+    # Runs inside pool workers: exceptions are returned, not raised, so one bad
+    # file can't poison the pool.
+    try:
+        return (*extract_text_pages(filepath), None)
+    except Exception as e:
+        return "", 0, str(e)
+
+
+_started = None  # in pool workers: shared array of start times, indexed by task
+
+
+def _init_worker(started):
+    global _started
+    _started = started
+
+
+def _pool_extract(i, filepath):
+    _started[i] = time.time()
+    return _safe_extract(filepath)
+
+
+def default_workers():
+    return max(1, min(8, (os.cpu_count() or 1) - 1))
+
+
+class _ExtractPool:
+    """PDF extraction on worker processes, with a deadline per file counted from when a worker starts it.
+
+    A file past its deadline is given up by terminating the pool, which kills
+    the hung parser; the files that had not finished yet are resubmitted to a
+    new pool.
+    """
+
+    def __init__(self, filepaths, indices, workers, timeout):
+        self.filepaths = filepaths
+        self.workers = workers
+        self.timeout = timeout
+        self.results = {}  # task -> (text, pages, error)
+        # spawn keeps workers clean of the parent's threads (Streamlit runs several)
+        self.context = multiprocessing.get_context("spawn")
+        # Start time per task (0 until a worker picks it up); shared memory, so
+        # workers never block on a pipe the parent isn't reading
+        self.started = self.context.RawArray("d", len(filepaths))
+        self.pool = None
+        self._start(indices)
+
+    def _start(self, indices):
+        for i in indices:
+            self.started[i] = 0.0
+        self.pool = self.context.Pool(processes=min(self.workers, len(indices)), initializer=_init_worker,
+                                      initargs=(self.started,))
+        self.pending = {i: self.pool.apply_async(_pool_extract, (i, self.filepaths[i])) for i in indices}
+
+    def get(self, i):
+        """(text, pages, error) of task `i`, or None when it ran past its deadline."""
+        if i in self.results:
+            return self.results.pop(i)
+        result = self.pending[i]
+        while True:
+            try:
+                return result.get(timeout=POLL_SECONDS)
+            except multiprocessing.TimeoutError:
+                pass
+            started = self.started[i]
+            if started and time.time() - started > self.timeout:
+                self._restart_without(i)
+                return None
+
+    def _restart_without(self, timed_out):
+        # Keep what already finished, then kill the pool (and the hung parser in it)
+        unfinished = []
+        for i, result in self.pending.items():
+            if i == timed_out or i in self.results:
+                continue
+            if result.ready():
+                self.results[i] = result.get()
+            else:
+                unfinished.append(i)
+        self.close(terminate=True)
+        self.pending = {}
+        if unfinished:
+            self._start(unfinished)
+
+    def close(self, terminate=False):
+        if self.pool is None:
+            return
+        if terminate:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.pool = None
+
+
+def extract_documents(filepaths, workers=None, timeout=DEFAULT_EXTRACT_TIMEOUT, metrics=None, progress=None):
+    """Extracts text for every path, returning a list aligned with `filepaths`.
+
+    PDFs are parsed on a process pool of up to `workers` processes, so a
+    parser that hangs can be killed: a PDF still running `timeout` seconds
+    after a worker started it is skipped. Text files and workbooks are read
+    in-process. A file that times out has the entry None.
+
+    With `metrics` (a utils.metrics.Metrics), counts files, pages, extracted
+    characters, failures and timeouts. `progress(done, total)` is called after
+    each file.
+    """
+    if workers is None:
+        workers = default_workers()
+    texts = [None] * len(filepaths)
+    pooled = {i for i, path in enumerate(filepaths) if path.lower().endswith(".pdf")}
+    pool = _ExtractPool(filepaths, sorted(pooled), max(workers, 1), timeout) if pooled else None
+
+    try:
+        for i, filepath in enumerate(filepaths):
+            filename = os.path.basename(filepath)
+            if i in pooled:
+                result = pool.get(i)
+                if result is None:
+                    logger.warning("Skipping %s: extraction timed out after %ss", filename, timeout)
+                    if metrics is not None:
+                        metrics.count("extract_timeouts")
+                    if progress is not None:
+                        progress(i + 1, len(filepaths))
+                    continue
+                text, pages, error = result
+            else:
+                text, pages, error = _safe_extract(filepath)
+            if error:
+                logger.warning("Skipping %s: %s", filename, error)
+            if metrics is not None:
+                metrics.count("files_extracted")
+                metrics.count("pages", pages)
+                metrics.count("chars_extracted", len(text))
+                if error:
+                    metrics.count("extract_errors")
+            texts[i] = text
+            if progress is not None:
+                progress(i + 1, len(filepaths))
+    except BaseException:
+        if pool is not None:
+            pool.close(terminate=True)
+        raise
+    if pool is not None:
+        pool.close()
+    return texts
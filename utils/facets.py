@@ -0,0 +1,133 @@
+import re
+import numpy as np
+
+FACETS = ("company", "year", "quarter", "doc_type")
+
+COMPANY_ALIASES = {
+    "KMB": ("kmb", "kimberly-clark", "kimberly clark"),
+    "Essity": ("essity",),
+    "Ontex": ("ontex",),
+}
+# documents/ holds Kimberly-Clark investor relations material, much of it not
+# named after the company (e.g. "Presentation Slides.pdf")
+DEFAULT_COMPANY = "KMB"
+
+# First matching rule wins; keywords are matched against the lowercased file name
+DOC_TYPE_RULES = [
+    ("press_release", ("press release",)),
+    ("transcript", ("management discussion", "management remarks", "conference call", "interview", "webcast")),
+    ("financial_schedules", ("financial schedules", "tables", "non-gaap", ".xlsx")),
+    ("annual_report", ("annual report", "10-k")),
+    ("filing", ("8-k", "proxy", "stockholder")),
+    ("slides", ("slides", "presentation", "infographic", "powering care")),
+    ("event", ("conference", "forum", "plant tour")),
+    ("press_release", ("earnings",)),
+]
+DOC_TYPES = ("transcript", "press_release", "slides", "annual_report", "financial_schedules", "filing", "event", "other")
+
+QUARTER_WORDS = {"first": 1, "second": 2, "third": 3, "fourth": 4}
+YEAR_RE = re.compile(r"(?<!\d)(20\d\d)(?!\d)")
+QUARTER_RE = re.compile(r"\b(?:q([1-4])|([1-4])q)\b")
+QUARTER_WORDS_RE = re.compile(r"\b(first|second|third|fourth) quarter\b")
+
+
+def _quarters(text):
+    quarters = [int(a or b) for a, b in QUARTER_RE.findall(text)]
+    quarters += [QUARTER_WORDS[word] for word in QUARTER_WORDS_RE.findall(text)]
+    return quarters
+
+
+def _companies(text):
+    return [company for company, aliases in COMPANY_ALIASES.items() if any(alias in text for alias in aliases)]
+
+
+def document_facets(path):
+    """Derives {company, year, quarter, doc_type} from a manifest path such as
+    'documents/2025/KMB 3Q 2025 Earnings Press Release.pdf' or 'transcripts/KMB_Q3_2025.txt'."""
+    parts = path.replace("\\", "/").split("/")
+    filename = parts[-1]
+    name = filename.lower().replace("_", " ")
+
+    companies = _companies(name)
+    years = YEAR_RE.findall(filename) or [p for p in parts[:-1] if YEAR_RE.fullmatch(p)]
+    quarters = _quarters(name)
+
+    if parts[0] == "transcripts":
+        doc_type = "transcript"
+    else:
+        doc_type = next((t for t, keywords in DOC_TYPE_RULES if any(k in name for k in keywords)), "other")
+
+    return {
+        "company": companies[0] if companies else DEFAULT_COMPANY,
+        "year": int(years[0]) if years else None,
+        "quarter": quarters[0] if quarters else None,
+        "doc_type": doc_type,
+    }
+
+
+def detect_facets(query):
+    """Best-effort filters from the question text, e.g. 'KMB tariffs in Q3 2025' ->
+    {'company': ['KMB'], 'year': [2025], 'quarter': [3]}."""
+    text = query.lower()
+    filters = {}
+    companies = _companies(text)
+    if companies:
+        filters["company"] = companies
+    years = sorted({int(y) for y in YEAR_RE.findall(text)})
+    if years:
+        filters["year"] = years
+    quarters = sorted(set(_quarters(text)))
+    if quarters:
+        filters["quarter"] = quarters
+    doc_types = []
+    if re.search(r"\b(transcripts?|calls?|remarks)\b", text):
+        doc_types.append("transcript")
+    if "press release" in text:
+        doc_types.append("press_release")
+    if re.search(r"\b(slides?|decks?|presentations?)\b", text):
+        doc_types.append("slides")
+    if "annual report" in text or "10-k" in text:
+        doc_types.append("annual_report")
+    if doc_types:
+        filters["doc_type"] = doc_types
+    return filters
+
+
+class FacetIndex:
+    """Per-facet chunk bitmaps, so retrieval can be restricted to e.g. KMB 2025 transcripts.
+
+    Facets are stored per document and expanded to one boolean bitmap over
+    chunks per (facet, value). A filter ORs the values within a facet and ANDs
+    across facets.
+    """
+
+    def __init__(self, doc_facets, chunk_doc_ids):
+        self.doc_facets = doc_facets
+        self.num_chunks = len(chunk_doc_ids)
+        self.bitmaps = {facet: {} for facet in FACETS}
+        for facet in FACETS:
+            doc_values = [facets[facet] for facets in doc_facets]
+            for value in set(doc_values):
+                if value is None:
+                    continue
+                doc_mask = np.array([v == value for v in doc_values], dtype=bool)
+                self.bitmaps[facet][value] = doc_mask[chunk_doc_ids]
+
+    def values(self, facet):
+        return sorted(self.bitmaps[facet])
+
+    def select(self, filters):
+        """Sorted chunk ids matching `filters` ({facet: value or [values]}), or None for no filter."""
+        if not filters:
+            return None
+        mask = np.ones(self.num_chunks, dtype=bool)
+        for facet, values in filters.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            facet_mask = np.zeros(self.num_chunks, dtype=bool)
+            for value in values:
+                bitmap = self.bitmaps.get(facet, {}).get(value)
+                if bitmap is not None:
+                    facet_mask |= bitmap
+            mask &= facet_mask
+        return np.flatnonzero(mask)
@@ -0,0 +1,485 @@
+import os
+import re
+import calendar
+import datetime
+import logging
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.facets import document_facets
+from utils.index_cache import build_manifest, manifest_key
+from utils.metrics import Metrics
+from utils.spreadsheet import SHEET_FORMAT_VERSION, SPREADSHEET_EXTENSIONS, iter_sheets, walk_sheet
+
+logger = logging.getLogger("argus.facts")
+
+# Bump when extraction changes, so a cached fact table from older code is rebuilt
+FACTS_VERSION = 2
+FACTS_FILE = "facts.parquet"
+KEY_METADATA = b"argus_manifest_key"
+
+# Workbooks with the quarterly schedules and the recast tables; the "... Earnings.xlsx"
+# downloads are copies of the schedules
+FACT_WORKBOOK_RE = re.compile(r"financial schedules|recast", re.IGNORECASE)
+COLUMNS = [
+    "company", "metric", "period", "period_end", "months", "statement", "line_item", "segment",
+    "value", "unit", "source", "recast", "restated", "as_of",
+]
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+DATE_RE = re.compile(r"\b(" + "|".join(MONTHS) + r")\s+(\d{1,2})\b", re.IGNORECASE)
+YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+DURATION_RE = re.compile(r"\b(three|six|nine|twelve) months\b|\byears? ended\b|\bfull year\b", re.IGNORECASE)
+DURATION_MONTHS = {"three": 3, "six": 6, "nine": 9, "twelve": 12}
+SHEET_PERIOD_RE = re.compile(r"\bQ([1-4])'(\d{2})\b")
+FOOTNOTE_RE = re.compile(r"\s*\([a-z]\)$")
+PERCENT_RE = re.compile(r"percent|%|\bchange\b", re.IGNORECASE)
+PERCENT_ITEM_RE = re.compile(r"\b(growth|rate|margin)\b", re.IGNORECASE)
+
+# Sheet title keywords -> statement, first match wins
+STATEMENT_RULES = [
+    ("balance", "balance_sheet"),
+    ("cash flow", "cash_flow"),
+    ("non-gaap", "non_gaap"),
+    ("segment ns", "net_sales_drivers"),
+    ("net sales (unaudited)", "net_sales_drivers"),
+    ("segment", "segment"),
+    ("discontinued", "discontinued_operations"),
+    ("income", "income_statement"),
+    ("is qtd", "income_statement"),
+    ("is ytd", "income_statement"),
+]
+# Row and column labels that name a business segment rather than a line item
+SEGMENTS = {
+    "na": "NA",
+    "ipc": "IPC",
+    "ifp": "IFP",
+    "personal care": "Personal Care",
+    "consumer tissue": "Consumer Tissue",
+    "kc professional": "K-C Professional",
+    "k-c professional": "K-C Professional",
+    "corporate & other": "Corporate & Other",
+    "consolidated": "Total",
+    "total": "Total",
+}
+# Regions reported under the 2024 segments, e.g. "Personal Care" then "North America"
+REGIONS = {"north america", "d&e markets", "developed markets"}
+# Net sales driver tables have the drivers as columns; named like the non-GAAP rows
+DRIVER_METRICS = {
+    "volume": "volume",
+    "mix/other": "mix_other",
+    "price": "net_price",
+    "net price": "net_price",
+    "currency": "currency_translation",
+    "currency translation": "currency_translation",
+    "divestitures and business exits": "divestitures_and_business_exits",
+    "total": "net_sales_growth",
+    "organic": "organic_sales_growth",
+}
+# Statements about part of the company get their own metric names: the IFP
+# business' net sales are not the company's net sales
+STATEMENT_METRIC_PREFIX = {"discontinued_operations": "discontinued_"}
+METRIC_ALIASES = {
+    "sales": "net_sales",
+    "revenue": "net_sales",
+    "organic_growth": "organic_sales_growth",
+    "eps": "diluted_earnings_per_share",
+}
+DEFAULT_UNIT = "USD millions"  # every schedule reports in millions except per-share figures and percentages
+
+
+def slugify(text):
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")
+
+
+def _strip_footnote(text):
+    return FOOTNOTE_RE.sub("", text).strip()
+
+
+def _is_period_text(text):
+    return bool(DURATION_RE.search(text) or DATE_RE.search(text) or YEAR_RE.fullmatch(text.strip()))
+
+
+def _statement(sheet):
+    title = sheet.lower()
+    return next((statement for keyword, statement in STATEMENT_RULES if keyword in title), slugify(sheet))
+
+
+def period_label(period_end, months):
+    """'2025Q3', '2025 9M', 'FY2024' or the date itself for balance sheet figures."""
+    if months == 3:
+        return f"{period_end.year}Q{(period_end.month - 1) // 3 + 1}"
+    if months == 12:
+        return f"FY{period_end.year}"
+    if months == 0:
+        return period_end.isoformat()
+    return f"{period_end.year} {months}M"
+
+
+def parse_period(parts, sheet):
+    """(period end, months) from the period texts of a value's headers and row, or None.
+
+    Months is 0 for point-in-time figures (balance sheets). A value whose
+    headers name no period at all takes the sheet's, e.g. "Q3'24 QTD Segment NS".
+    """
+    text = " ".join(parts)
+    sheet_period = SHEET_PERIOD_RE.search(sheet)
+    if not parts and sheet_period is None:
+        return None
+    duration = DURATION_RE.search(text)
+    dates = DATE_RE.findall(text)
+    years = YEAR_RE.findall(text)
+    if not parts:
+        quarter, year = int(sheet_period.group(1)), 2000 + int(sheet_period.group(2))
+        month, day, years = quarter * 3, None, [str(year)]
+    elif dates:
+        month, day = MONTHS[dates[-1][0].lower()], int(dates[-1][1])
+    else:
+        return None
+    if not years:
+        return None  # e.g. the "Change" column under "Three Months Ended September 30"
+    year = int(years[-1])
+    day = day or calendar.monthrange(year, month)[1]
+    try:
+        period_end = datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+    title = sheet.lower()
+    if duration is not None:
+        word = (duration.group(1) or "").lower()
+        months = DURATION_MONTHS.get(word, 12)
+    elif "qtd" in title or "quarterly" in title:
+        months = 3
+    elif "ytd" in title:
+        months = month  # fiscal year = calendar year
+    elif "full year" in title:
+        months = 12
+    else:
+        months = 0
+    return period_end, months
+
+
+def _unit(number_format, line_item, percent_hint):
+    if percent_hint or "%" in (number_format or "") or PERCENT_ITEM_RE.search(line_item):
+        return "percent"
+    if "per share" in line_item.lower():
+        return "USD per share"
+    if "shares" in line_item.lower():
+        return "shares (millions)"
+    return DEFAULT_UNIT
+
+
+def _row_name(parts, ambiguous):
+    """Line item name of a row: its label, qualified by the innermost section when the sheet
+    has the label under several sections ("Basic" and "Diluted" > "Continuing operations")."""
+    if not parts:
+        return ""
+    label = parts[-1]
+    if len(parts) > 1 and label.lower() in ambiguous and parts[-2].lower() not in label.lower():
+        return f"{parts[-2]} {label}"
+    return label
+
+
+def _split_rows(items, drivers):
+    """(row, period texts, line item parts, segment, values) of each data row of a sheet."""
+    rows = []
+    parent_segment = None
+    for _, row_number, path, values in items:
+        periods, parts, segment = [], [], None
+        for part in path:
+            name = _strip_footnote(part)
+            key = name.lower()
+            if _is_period_text(part):
+                periods.append(part)
+            elif key in SEGMENTS:
+                segment = parent_segment = SEGMENTS[key]
+            elif key in REGIONS and parent_segment not in (None, "Total"):
+                segment = f"{parent_segment} {name}"
+            elif drivers:
+                segment = name  # driver tables have one row per segment or region
+            else:
+                parts.append(name)
+        rows.append((row_number, periods, parts, segment, values))
+    return rows
+
+
+def sheet_facts(sheet, rows):
+    """Facts (dicts of COLUMNS but company, source file, recast, restated and as_of) of one sheet."""
+    statement = _statement(sheet)
+    drivers = statement == "net_sales_drivers"
+    data_rows = _split_rows([item for item in walk_sheet(rows) if item[0] == "data"], drivers)
+    sections = {}  # label -> the sections it appears under
+    for _, _, parts, _, _ in data_rows:
+        if parts:
+            sections.setdefault(parts[-1].lower(), set()).add(tuple(parts[:-1]))
+    ambiguous = {label for label, under in sections.items() if len(under) > 1}
+
+    facts = []
+    for row_number, row_periods, row_parts, row_segment, values in data_rows:
+        for header, value, number_format in values:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            periods, column_parts, segment, percent_hint = list(row_periods), [], row_segment, drivers
+            for part in header:
+                name = _strip_footnote(part)
+                if _is_period_text(part):
+                    periods.append(part)
+                elif PERCENT_RE.search(part):
+                    percent_hint = True
+                elif not drivers and name.lower() in SEGMENTS:
+                    segment = SEGMENTS[name.lower()]
+                else:
+                    column_parts.append(name)
+            period = parse_period(periods, sheet)
+            if period is None:
+                continue
+            if drivers:
+                metric = " ".join(column_parts)
+                metric = DRIVER_METRICS.get(metric.lower(), slugify(metric))
+                line_item = " > ".join(column_parts)
+            else:
+                metric = slugify(" ".join([_row_name(row_parts, ambiguous)] + column_parts))
+                metric = STATEMENT_METRIC_PREFIX.get(statement, "") + metric if metric else metric
+                line_item = " > ".join(row_parts + column_parts)
+            if not metric:
+                continue
+            unit = _unit(number_format, line_item, percent_hint)
+            if "%" in (number_format or ""):
+                value = value * 100  # percentages are stored as percentage points
+            facts.append({
+                "metric": metric,
+                "period": period_label(*period),
+                "period_end": period[0],
+                "months": period[1],
+                "statement": statement,
+                "line_item": line_item,
+                "segment": segment or "Total",
+                "value": float(value),
+                "unit": unit,
+                "source": f"[{sheet}, row {row_number}]",
+            })
+    return facts
+
+
+def workbook_facts(filepath, rel_path):
+    """Facts of every sheet of a workbook, with company, source and publication (as_of, recast) filled in.
+
+    `restated` is left False; it depends on the other workbooks (see mark_restated).
+    """
+    filename = os.path.basename(filepath)
+    company = document_facets(rel_path)["company"]
+    recast = "recast" in filename.lower()
+    facts = []
+    for sheet, rows in iter_sheets(filepath):
+        for fact in sheet_facts(sheet, rows):
+            fact.update(company=company, source=f"{filename} {fact['source']}", recast=recast, restated=False)
+            facts.append(fact)
+    # Later publications supersede earlier ones for the same period
+    as_of = max((fact["period_end"] for fact in facts), default=None)
+    for fact in facts:
+        fact["as_of"] = as_of
+    return facts
+
+
+def mark_restated(table):
+    """Sets `restated` on facts whose value differs from the first published value of their metric, period and segment.
+
+    Publications are ordered by as_of; a recast workbook comes after the
+    regular schedules of the same period.
+    """
+    published = table.sort_values(["as_of", "recast"], kind="stable")
+    first = published.groupby(["metric", "period_end", "months", "segment"], sort=False)["value"].transform("first")
+    table["restated"] = (published["value"] != first).reindex(table.index)
+    return table
+
+
+class FactTable:
+    """The fact table sorted by (metric, period_end), with the offsets of each metric's rows.
+
+    Immutable once built, so a query running during a rebuild keeps a
+    consistent table.
+    """
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key  # manifest key of the workbooks it was built from
+        metric_values = table["metric"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, metric_values[1:] != metric_values[:-1]]) if len(table) else []
+        ends = np.r_[starts[1:], len(table)] if len(table) else []
+        self.offsets = {metric_values[start]: (int(start), int(end)) for start, end in zip(starts, ends)}
+        self.period_ends = table["period_end"].to_numpy()
+
+    def __len__(self):
+        return len(self.table)
+
+    def rows(self, metric, start=None, end=None):
+        """A metric's rows with period end dates in [start, end], by binary search."""
+        lo, hi = self.offsets.get(metric, (0, 0))
+        ends = self.period_ends[lo:hi]
+        first = int(np.searchsorted(ends, np.datetime64(start, "ns"), "left")) if start is not None else 0
+        last = int(np.searchsorted(ends, np.datetime64(end, "ns"), "right")) if end is not None else len(ends)
+        return self.table.iloc[lo + first:lo + last]
+
+
+class FactStore:
+    """Financial facts from the schedule and recast workbooks, as one columnar table.
+
+    Every reported figure becomes a row (company, metric, period, statement,
+    line item, segment, value, unit, source, recast and restated flags). The
+    table is stored as Parquet sorted by (metric, period_end) and rebuilt
+    only when the workbooks change. Queries binary-search the metric's slice instead of
+    opening Excel files, e.g. `query("organic sales growth", months=3, last=8)`.
+    A rebuild swaps in a new FactTable; it is safe to query from other threads.
+    """
+
+    def __init__(self, documents_dir, cache_dir=None):
+        self.documents_dir = documents_dir
+        self.base_dir = os.path.dirname(os.path.abspath(documents_dir))
+        if cache_dir is None:
+            cache_dir = os.path.join(self.base_dir, ".rag_cache")
+        self.path = os.path.join(cache_dir, FACTS_FILE)
+        self.facts = None  # FactTable
+        self.manifest = None  # last listing of the workbooks
+        self.lock = threading.Lock()
+        self.last_metrics = None
+
+    @property
+    def is_ready(self):
+        return self.facts is not None
+
+    def _manifest(self):
+        # The previous listing lets unchanged files skip hashing
+        manifest = self.manifest = build_manifest(
+            [self.documents_dir], SPREADSHEET_EXTENSIONS, self.base_dir, previous=self.manifest
+        )
+        workbooks, seen = [], set()
+        for entry in manifest:
+            # Some workbooks are published twice under different names
+            if FACT_WORKBOOK_RE.search(os.path.basename(entry["path"])) and entry["sha1"] not in seen:
+                seen.add(entry["sha1"])
+                workbooks.append(entry)
+        return workbooks
+
+    def build(self):
+        """Loads the cached table, or extracts it when the workbooks changed. Returns a status line.
+
+        Cheap to call again: unchanged workbooks are not re-hashed and the loaded table is kept.
+        """
+        metrics = Metrics("build_facts")
+        try:
+            with self.lock:
+                return self._build(metrics)
+        finally:
+            self.last_metrics = metrics.finish()
+
+    def _build(self, metrics):
+        if not os.path.exists(self.documents_dir):
+            return "Documents directory not found."
+        with metrics.span("manifest"):
+            manifest = self._manifest()
+            key = manifest_key(manifest, {"facts": FACTS_VERSION, "sheet_format": SHEET_FORMAT_VERSION})
+        metrics.count("workbooks", len(manifest))
+        if self.facts is not None and self.facts.key == key:
+            return f"{len(self.facts)} facts are up to date."
+
+        with metrics.span("cache_load"):
+            table = self._load(key)
+        if table is not None:
+            self.facts = FactTable(table, key)
+            metrics.count("facts", len(table))
+            return f"Loaded {len(table)} facts from cache."
+
+        facts = []
+        with metrics.span("extract"):
+            for entry in manifest:
+                filepath = os.path.join(self.base_dir, entry["path"])
+                try:
+                    facts.extend(workbook_facts(filepath, entry["path"]))
+                except Exception as e:
+                    metrics.count("extract_errors")
+                    logger.warning("Skipping %s: %s", os.path.basename(filepath), e)
+        table = pd.DataFrame(facts, columns=COLUMNS)
+        table["period_end"] = pd.to_datetime(table["period_end"])
+        table["as_of"] = pd.to_datetime(table["as_of"])
+        table["months"] = table["months"].astype(np.int8)
+        table = mark_restated(table)
+        table = table.sort_values(["metric", "period_end", "months", "segment"], kind="stable").reset_index(drop=True)
+        metrics.count("facts", len(table))
+        try:
+            with metrics.span("cache_save"):
+                self._save(table, key)
+        except OSError as e:
+            logger.warning("Could not write fact table: %s", e)
+        self.facts = FactTable(table, key)
+        return f"Extracted {len(table)} facts from {len(manifest)} workbooks."
+
+    def _load(self, key):
+        try:
+            if pq.read_schema(self.path).metadata.get(KEY_METADATA) != key.encode():
+                return None
+            return pq.read_table(self.path).to_pandas()
+        except (OSError, pa.ArrowException):
+            return None
+
+    def _save(self, table, key):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        arrow_table = arrow_table.replace_schema_metadata({**(arrow_table.schema.metadata or {}), KEY_METADATA: key.encode()})
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        pq.write_table(arrow_table, temp_path)
+        os.replace(temp_path, self.path)
+
+    def resolve(self, metric):
+        """The stored metric name for a name typed by a person, e.g. "Organic Sales Growth"."""
+        name = slugify(metric)
+        return METRIC_ALIASES.get(name, name)
+
+    def metrics(self):
+        """{metric: number of facts}, for choosing what to query."""
+        facts = self.facts
+        if facts is None:
+            return {}
+        return {metric: end - start for metric, (start, end) in facts.offsets.items()}
+
+    def find_metrics(self, text):
+        """Metrics whose name contains every word of `text`."""
+        words = slugify(text).split("_")
+        return [metric for metric in self.metrics() if all(word in metric.split("_") for word in words)]
+
+    def query(self, metric, segment="Total", months=None, start=None, end=None, last=None, all_versions=False,
+              mixed_basis=False):
+        """Facts of one metric, oldest period first.
+
+        `segment` None returns every segment. `months` selects the period
+        length (3 for quarters, 12 for years, 0 for balance sheet dates) and
+        `start`/`end` bound the period end dates; `last` keeps the most
+        recent periods only. A period reported in several workbooks is
+        returned once, from the latest publication (a recast after the
+        regular schedules), unless `all_versions` is set.
+
+        A restatement changes the basis of a series from its first restated
+        period on. Earlier periods that were never re-reported are on the
+        superseded basis and are left out unless `mixed_basis` is set, so
+        e.g. pre-recast 2023 net sales don't sit next to recast 2024 figures.
+        """
+        facts = self.facts
+        if facts is None:
+            return pd.DataFrame(columns=COLUMNS)
+        rows = facts.rows(self.resolve(metric), start, end)
+        if segment is not None:
+            rows = rows[rows["segment"] == segment]
+        if months is not None:
+            rows = rows[rows["months"] == months]
+        if not all_versions:
+            rows = rows.sort_values(["period_end", "months", "segment", "as_of", "recast"], kind="stable")
+            rows = rows.drop_duplicates(["period_end", "months", "segment"], keep="last")
+            if not mixed_basis:
+                restated_ends = rows["period_end"].where(rows["restated"])
+                first_restated = restated_ends.groupby([rows["segment"], rows["months"]]).transform("min")
+                rows = rows[first_restated.isna() | (rows["period_end"] >= first_restated)]
+        if last is not None:
+            rows = rows.tail(last)
+        return rows.reset_index(drop=True)
@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger("argus.folder_watcher")
+
+
+def folder_snapshot(root_dirs, extensions):
+    """(path, size, mtime_ns) of every supported file under `root_dirs`; stat only, no reads."""
+    entries = set()
+    for root_dir in root_dirs:
+        for root, _, files in os.walk(root_dir):
+            for filename in files:
+                if not filename.lower().endswith(extensions):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # deleted while walking
+                entries.add((path, stat.st_size, stat.st_mtime_ns))
+    return frozenset(entries)
+
+
+class FolderWatcher:
+    """Polls folders for added, changed or removed files and calls `on_change` once a burst settles.
+
+    Copying a quarter's worth of files shows up as many changes over several
+    seconds, so `on_change` only fires after the folders have stayed unchanged
+    for `debounce` seconds. Polling keeps this dependency-free and works the
+    same on network drives, where inotify events are unreliable.
+    """
+
+    def __init__(self, root_dirs, extensions, on_change, interval=5.0, debounce=10.0):
+        self.root_dirs = list(root_dirs)
+        self.extensions = tuple(extensions)
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self.stop_event = threading.Event()
+        self.baseline = None
+        self.thread = None
+
+    def start(self):
+        """Takes the baseline now, so a change made right after start() is seen, then polls on a thread."""
+        self.baseline = self._snapshot()
+        self.thread = threading.Thread(target=self._run, name="rag-folder-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _snapshot(self):
+        return folder_snapshot(self.root_dirs, self.extensions)
+
+    def _run(self):
+        baseline = self.baseline
+        pending = None  # latest snapshot that differs from the baseline, while waiting for quiet
+        last_change = None
+        while not self.stop_event.wait(self.interval):
+            try:
+                current = self._snapshot()
+            except OSError as e:
+                logger.warning("Could not scan %s: %s", self.root_dirs, e)
+                continue
+            if current != (baseline if pending is None else pending):
+                pending = current
+                last_change = time.monotonic()
+            elif pending is not None and time.monotonic() - last_change >= self.debounce:
+                changed = pending != baseline
+                baseline, pending = pending, None
+                if changed:
+                    logger.info("Document folders changed, reindexing")
+                    try:
+                        self.on_change()
+                    except Exception:
+                        logger.exception("Folder change handler failed")
@@ -0,0 +1,181 @@
+import time
+import queue
+import threading
+from utils.llm_transport import LLMCancelled, latency_histogram
+from utils.metrics import Metrics
+
+
+class HedgePolicy:
+    """When to send the backup request: once the primary is slower than its `quantile` latency.
+
+    The delay comes from the primary provider's latency histogram, so it
+    follows how the provider behaves right now; with fewer than `min_samples`
+    samples it is `default_delay`. It is kept within [min_delay, max_delay],
+    which bounds the extra load to the slowest few percent of requests.
+    """
+
+    def __init__(self, quantile=0.9, default_delay=2.0, min_delay=0.25, max_delay=10.0, min_samples=20):
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+
+    def delay(self, histogram):
+        if histogram.total < self.min_samples:
+            return self.default_delay
+        return min(max(histogram.quantile(self.quantile), self.min_delay), self.max_delay)
+
+
+class _Hedge:
+    """Runs the primary and (after the delay) the backup call on threads, collecting their events."""
+
+    def __init__(self, legs, kind, run_leg, metrics, policy, cancel, admit_backup, on_pick):
+        self.legs = legs  # [(transport, model), (transport, model)]
+        self.kind = kind  # latency histogram the delay is read from
+        self.run_leg = run_leg  # run_leg(i, leg_metrics, leg_cancel, emit) does one call, emitting its events
+        self.metrics = metrics
+        self.cancel = cancel
+        self.admit_backup = admit_backup  # returns False when the backup must not be sent (rate limited)
+        self.on_pick = on_pick  # called with the index of the leg whose answer is used
+        self.events = queue.Queue()
+        self.leg_metrics = [Metrics("llm") for _ in legs]
+        self.leg_cancels = [threading.Event() for _ in legs]
+        self.launched = [None] * len(legs)  # start time per leg
+        self.failed = set()
+        self.winner = None
+        self.delay = policy.delay(latency_histogram(legs[0][0].name, kind))
+        metrics.add_time("hedge_delay", self.delay)
+        self._launch(0)
+
+    def _launch(self, i):
+        def run():
+            try:
+                self.run_leg(i, self.leg_metrics[i], self.leg_cancels[i], lambda kind, value: self.events.put((i, kind, value)))
+            except Exception as e:
+                self.events.put((i, "error", e))
+
+        self.launched[i] = time.monotonic()
+        if i and self.admit_backup is not None and not self.admit_backup():
+            self.metrics.count("hedge_rate_limited")
+            self.failed.add(i)
+            return
+        if i:
+            self.metrics.count("hedged")
+        threading.Thread(target=run, name=f"llm-hedge-{i}", daemon=True).start()
+
+    def next_event(self):
+        """The next (leg, kind, value) event; launches the backup once the delay has passed."""
+        while True:
+            if self.cancel is not None and self.cancel.is_set():
+                raise LLMCancelled("cancelled")
+            wait = 0.1  # wake up regularly to notice cancellation
+            # Once a leg has won (a stream keeps going past the delay) there is nothing left to hedge
+            waiting_to_hedge = self.launched[1] is None and self.winner is None
+            if waiting_to_hedge:
+                wait = min(wait, max(self.launched[0] + self.delay - time.monotonic(), 0.0))
+            try:
+                return self.events.get(timeout=wait)
+            except queue.Empty:
+                if waiting_to_hedge and time.monotonic() >= self.launched[0] + self.delay:
+                    self._launch(1)
+
+    def pick(self, i):
+        self.winner = i
+        if i:
+            self.metrics.count("hedge_backup_won")
+        if self.on_pick is not None:
+            self.on_pick(i)
+        now = time.monotonic()
+        for j, started in enumerate(self.launched):
+            if j != i and started is not None and j not in self.failed:
+                self.leg_cancels[j].set()
+                # The loser took at least this long; without the sample a provider
+                # that keeps losing would look faster than it is. The cancelled
+                # call itself records no latency (see LLMTransport.chat).
+                transport = self.legs[j][0]
+                latency_histogram(transport.name, self.kind).observe(now - started)
+
+    def fail(self, i, error):
+        """Records a failed call before any winner: hedges right away, or raises once all failed."""
+        self.failed.add(i)
+        if self.launched[1] is None:
+            self._launch(1)
+        if len(self.failed) == len(self.legs):
+            raise error
+
+    def close(self):
+        for cancel in self.leg_cancels:
+            cancel.set()
+        for leg_metrics in self.leg_metrics:
+            for name, value in list(leg_metrics.counters.items()):
+                self.metrics.count(name, value)
+            for name, seconds in list(leg_metrics.spans.items()):
+                self.metrics.add_time(name, seconds)
+
+
+def hedged_chat(primary, backup, messages, metrics, policy=None, cancel=None, admit_backup=None, on_pick=None,
+                **params):
+    """Chat completion from whichever of two (transport, model) pairs responds first.
+
+    The backup request is only sent when the primary has not answered within
+    the policy's delay, or has failed, and `admit_backup()` (if given) allows
+    it. The slower call is cancelled: it is not retried any more, but an HTTP
+    request already in flight runs to completion on its thread and its
+    response is dropped. `on_pick(i)` is told which call answered (0 primary,
+    1 backup).
+    """
+    def run_leg(i, leg_metrics, leg_cancel, emit):
+        transport, model = (primary, backup)[i]
+        emit("done", transport.chat(messages, model, leg_metrics, leg_cancel, **params))
+
+    hedge = _Hedge([primary, backup], "response", run_leg, metrics, policy or HedgePolicy(), cancel,
+                   admit_backup, on_pick)
+    try:
+        while True:
+            i, kind, value = hedge.next_event()
+            if kind == "error":
+                hedge.fail(i, value)
+                continue
+            hedge.pick(i)
+            return value
+    finally:
+        hedge.close()
+
+
+def hedged_stream(primary, backup, messages, metrics, policy=None, cancel=None, admit_backup=None, on_pick=None,
+                  **params):
+    """Streams text deltas from whichever of two (transport, model) pairs sends a first token first.
+
+    The backup request is only sent when the primary has not streamed a
+    token within the policy's delay, or has failed, and `admit_backup()` (if
+    given) allows it. The first call to produce a token wins and the other
+    one's stream is closed; a stream can't switch providers once tokens have
+    been shown. `on_pick(i)` is told which call won (0 primary, 1 backup).
+    """
+    def run_leg(i, leg_metrics, leg_cancel, emit):
+        transport, model = (primary, backup)[i]
+        for delta in transport.stream_chat(messages, model, leg_metrics, leg_cancel, **params):
+            emit("delta", delta)
+        emit("done", None)
+
+    hedge = _Hedge([primary, backup], "first_token", run_leg, metrics, policy or HedgePolicy(), cancel,
+                   admit_backup, on_pick)
+    try:
+        while True:
+            i, kind, value = hedge.next_event()
+            if hedge.winner is None:
+                if kind == "error":
+                    hedge.fail(i, value)
+                    continue
+                hedge.pick(i)
+            if i != hedge.winner:
+                continue
+            if kind == "delta":
+                yield value
+            elif kind == "done":
+                return
+            else:
+                raise value
+    finally:
+        hedge.close()
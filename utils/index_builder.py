@@ -0,0 +1,146 @@
+import os
+import logging
+import threading
+from utils.folder_watcher import FolderWatcher
+from utils.rag_index import SUPPORTED_EXTENSIONS, DocumentIndex
+
+logger = logging.getLogger("argus.index_builder")
+
+
+class BackgroundIndexBuilder:
+    """Builds a DocumentIndex on a background thread and serves a partial index meanwhile.
+
+    When the full corpus is not cached yet, the `priority_dirs` (e.g. the
+    transcripts folder, which is small and text only) are indexed first into a
+    separate partial index that can answer questions while the slow PDF
+    extraction for the full corpus runs. `index` is always the best index
+    available so far and `partial` says whether it covers only part of the
+    corpus. All attributes are safe to read from other threads.
+
+    `reindex()` (called by the folder watcher, see `watch()`) rebuilds the
+    index incrementally while the current one keeps serving, then swaps the
+    new one in. The swap only replaces a reference: queries already running
+    keep the index object they started with.
+    """
+
+    def __init__(self, transcripts_dir, priority_dirs=None, **index_options):
+        self.transcripts_dir = transcripts_dir
+        self.priority_dirs = [d for d in (priority_dirs or []) if os.path.isdir(d)]
+        self.index_options = index_options
+        self.full_index = DocumentIndex(transcripts_dir, **index_options)
+        self.lock = threading.Lock()
+        self.index = None
+        self.partial = False
+        self.status = "Waiting to start."
+        self.stage = None
+        self.files_done = 0
+        self.files_total = 0
+        self.done = False
+        self.version = 0  # bumped on every swap
+        self.reindex_pending = False
+        self.watcher = None
+
+    def start(self):
+        """Starts the build; an already cached corpus is loaded synchronously (it takes milliseconds)."""
+        if self.full_index.is_cached():
+            self._build_full(self.full_index)
+            return self
+        threading.Thread(target=self._run, name="rag-index-build", daemon=True).start()
+        return self
+
+    def watch(self, interval=5.0, debounce=10.0):
+        """Reindexes automatically when files under the indexed folders change.
+
+        Call it before start(), so a file changed while the first build reads
+        the folders is reindexed afterwards.
+        """
+        if self.watcher is None:
+            self.watcher = FolderWatcher(
+                self.full_index.source_dirs, SUPPORTED_EXTENSIONS, self.reindex, interval=interval, debounce=debounce
+            ).start()
+        return self
+
+    def reindex(self):
+        """Rebuilds the full index in the background and swaps it in; coalesces overlapping requests."""
+        with self.lock:
+            if not self.done:
+                # A build is running: run one more once it finishes, it may have missed files
+                self.reindex_pending = True
+                return False
+            self.done = False
+            self.stage = "update"
+            self.files_done = self.files_total = 0
+        threading.Thread(target=self._run_reindex, name="rag-index-update", daemon=True).start()
+        return True
+
+    def _progress(self, stage):
+        def update(done, total):
+            with self.lock:
+                self.stage = stage
+                self.files_done = done
+                self.files_total = total
+        return update
+
+    def _publish(self, index, status, partial):
+        with self.lock:
+            if index.is_ready:
+                self.index = index
+                self.partial = partial
+                self.version += 1
+            self.status = status
+
+    def _run(self):
+        try:
+            if self.priority_dirs:
+                self._build_partial()
+            self._build_full(self.full_index)
+        except Exception as e:
+            self._fail(e)
+
+    def _run_reindex(self):
+        try:
+            # A fresh object, so the index being served is never mutated mid-query;
+            # unchanged files come from the per-file segment cache
+            self._build_full(DocumentIndex(self.transcripts_dir, **self.index_options), stage="update")
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        logger.exception("Index build failed")
+        with self.lock:
+            self.status = f"Error building index: {error}"
+            self.done = True
+
+    def _build_partial(self):
+        # Own cache directory, so the partial build never touches the full index's
+        # latest manifest or evicts its entries
+        options = dict(self.index_options, extra_dirs=self.priority_dirs[1:])
+        options["cache_dir"] = os.path.join(self.full_index.cache.cache_dir, "partial")
+        index = DocumentIndex(self.priority_dirs[0], **options)
+        status = index.process_documents(progress=self._progress("priority"))
+        self._publish(index, status, partial=True)
+
+    def _build_full(self, index, stage="full"):
+        status = index.process_documents(progress=self._progress(stage))
+        if index.is_ready:
+            self.full_index = index
+        self._publish(index, status, partial=False)
+        with self.lock:
+            self.done = True
+            rerun, self.reindex_pending = self.reindex_pending, False
+        if rerun:
+            self.reindex()
+
+    def snapshot(self):
+        """A consistent view of the build state for display."""
+        with self.lock:
+            return {
+                "index": self.index,
+                "partial": self.partial,
+                "status": self.status,
+                "stage": self.stage,
+                "files_done": self.files_done,
+                "files_total": self.files_total,
+                "done": self.done,
+                "version": self.version,
+            }
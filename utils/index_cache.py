@@ -0,0 +1,256 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from scipy import sparse
+from utils.chunk_store import ChunkStore
+
+# Bump whenever the on-disk layout or the chunking/vectorizing logic changes,
+# so stale caches from older code are never loaded.
+CACHE_VERSION = 6
+
+logger = logging.getLogger("argus.index_cache")
+
+
+def file_sha1(filepath, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_manifest(root_dirs, extensions, base_dir, previous=None):
+    """Lists indexable files under root_dirs with size, mtime and content hash.
+
+    Paths are relative to base_dir, e.g. 'documents/2025/x.pdf'. Hashes are
+    reused from a previous manifest when size and mtime are unchanged.
+    """
+    known = {entry["path"]: entry for entry in (previous or [])}
+    manifest = []
+    for root_dir in root_dirs:
+        for root, dirs, files in os.walk(root_dir):
+            dirs.sort()
+            for filename in sorted(files):
+                if not filename.lower().endswith(extensions):
+                    continue
+                filepath = os.path.join(root, filename)
+                stat = os.stat(filepath)
+                rel_path = os.path.relpath(filepath, base_dir).replace(os.sep, "/")
+                old = known.get(rel_path)
+                if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                    sha1 = old["sha1"]
+                else:
+                    sha1 = file_sha1(filepath)
+                manifest.append({
+                    "path": rel_path,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "sha1": sha1,
+                })
+    return manifest
+
+
+def manifest_key(manifest, params):
+    """Stable digest of the corpus contents plus the parameters used to index it."""
+    h = hashlib.sha1()
+    h.update(json.dumps({"version": CACHE_VERSION, "params": params}, sort_keys=True).encode())
+    for entry in manifest:
+        # mtime is deliberately left out: touching a file must not invalidate the cache
+        h.update(f"{entry['path']}\0{entry['size']}\0{entry['sha1']}\n".encode())
+    return h.hexdigest()
+
+
+def diff_manifests(old, new):
+    """Returns (added, changed, removed) relative paths between two manifests."""
+    old_hashes = {entry["path"]: entry["sha1"] for entry in (old or [])}
+    new_hashes = {entry["path"]: entry["sha1"] for entry in new}
+    added = [path for path in new_hashes if path not in old_hashes]
+    changed = [path for path in new_hashes if path in old_hashes and old_hashes[path] != new_hashes[path]]
+    removed = [path for path in old_hashes if path not in new_hashes]
+    return added, changed, removed
+
+
+class IndexCache:
+    """Versioned on-disk store for fitted TF-IDF indexes.
+
+    Two layers live under the version directory:
+    - one directory per manifest key holding the assembled index, for warm starts;
+    - `segments/`, content-addressed per-file extraction results and term counts,
+      so an index over a changed corpus only has to process the changed files.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.version_dir = os.path.join(cache_dir, f"v{CACHE_VERSION}")
+        self.segments_dir = os.path.join(self.version_dir, "segments")
+
+    def _entry_dir(self, key):
+        return os.path.join(self.version_dir, key)
+
+    def has(self, key):
+        return os.path.isdir(self._entry_dir(key))
+
+    def latest_manifest(self):
+        """Returns the manifest of the most recently written entry, used to skip re-hashing."""
+        path = os.path.join(self.version_dir, "latest.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, key, mmap=True):
+        """Returns the cached index for `key` as a dict, or None on a cache miss.
+
+        Keys: chunks (ChunkStore), facets (per-document facet dicts), idf,
+        tfidf (CSR), postings (CSC term counts) and chunk_lengths. With mmap=True every array is a read-only view of the
+        files on disk, so all processes opening the same entry share its pages
+        through the OS page cache instead of each holding a private copy.
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+        mmap_mode = "r" if mmap else None
+
+        def array(name):
+            return np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            corpus_path = os.path.join(entry_dir, "corpus.bin")
+            if mmap and os.path.getsize(corpus_path) > 0:
+                corpus = np.memmap(corpus_path, dtype=np.uint8, mode="r")
+            else:
+                corpus = np.fromfile(corpus_path, dtype=np.uint8)
+            store = ChunkStore(
+                meta["filenames"], corpus,
+                array("chunk_doc_ids"), array("chunk_starts"), array("chunk_ends"),
+            )
+            shape = (meta["num_chunks"], meta["n_features"])
+            tfidf = sparse.csr_matrix(
+                (array("tfidf_data"), array("tfidf_indices"), array("tfidf_indptr")), shape=shape, copy=False
+            )
+            postings = sparse.csc_matrix(
+                (array("postings_data"), array("postings_indices"), array("postings_indptr")), shape=shape, copy=False
+            )
+            index = {
+                "chunks": store,
+                "facets": meta["facets"],
+                "idf": array("idf"),
+                "tfidf": tfidf,
+                "postings": postings,
+                "chunk_lengths": array("chunk_lengths"),
+            }
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable index cache %s: %s", entry_dir, e)
+            return None
+        return index
+
+    def save(self, key, manifest, store, facets, vectorizer, tfidf, postings, chunk_lengths, keep=3):
+        """Writes an entry atomically: files go to a temp dir which is then renamed into place.
+
+        Arrays are stored as plain .npy files so they can be opened with memmap.
+        """
+        entry_dir = self._entry_dir(key)
+        # Same key means same content, and other processes may have it mapped already
+        if not os.path.isdir(entry_dir):
+            self._write_entry(entry_dir, key, manifest, store, facets, vectorizer, tfidf, postings, chunk_lengths)
+
+        latest_tmp = os.path.join(self.version_dir, f"latest.json.{os.getpid()}.tmp")
+        with open(latest_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(latest_tmp, os.path.join(self.version_dir, "latest.json"))
+        self._prune(keep)
+
+    def _write_entry(self, entry_dir, key, manifest, store, facets, vectorizer, tfidf, postings, chunk_lengths):
+        os.makedirs(self.version_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key}.", dir=self.version_dir)
+        try:
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            meta = {
+                "filenames": store.filenames,
+                "facets": facets,
+                "num_chunks": len(store),
+                "n_features": vectorizer.n_features,
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            np.asarray(store.corpus, dtype=np.uint8).tofile(os.path.join(tmp_dir, "corpus.bin"))
+            arrays = {
+                "chunk_doc_ids": store.doc_ids,
+                "chunk_starts": store.starts,
+                "chunk_ends": store.ends,
+                "idf": vectorizer.idf_,
+                "tfidf_data": tfidf.data,
+                "tfidf_indices": tfidf.indices,
+                "tfidf_indptr": tfidf.indptr,
+                "postings_data": postings.data,
+                "postings_indices": postings.indices,
+                "postings_indptr": postings.indptr,
+                "chunk_lengths": chunk_lengths,
+            }
+            for name, values in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(values))
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Losing the race to another process writing the same entry is fine
+            if not os.path.isdir(entry_dir):
+                raise
+
+    def _prune(self, keep):
+        """Drops all but the `keep` most recently written entries."""
+        entries = [
+            os.path.join(self.version_dir, name)
+            for name in os.listdir(self.version_dir)
+            if not name.startswith(".") and name != "segments"
+            and os.path.isdir(os.path.join(self.version_dir, name))
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for stale in entries[keep:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    def _segment_paths(self, sha1, params_tag):
+        return (
+            os.path.join(self.segments_dir, f"{sha1}.txt"),
+            os.path.join(self.segments_dir, f"{sha1}.{params_tag}.npz"),
+        )
+
+    def load_segment(self, sha1, params_tag):
+        """Returns (text, chunk_counts) cached for a file's content, or None."""
+        text_path, counts_path = self._segment_paths(sha1, params_tag)
+        try:
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            counts = sparse.load_npz(counts_path).tocsr()
+        except (OSError, ValueError):
+            return None
+        return text, counts
+
+    def save_segment(self, sha1, params_tag, text, counts):
+        os.makedirs(self.segments_dir, exist_ok=True)
+        text_path, counts_path = self._segment_paths(sha1, params_tag)
+        suffix = f".{os.getpid()}.tmp"
+        with open(text_path + suffix, "w", encoding="utf-8") as f:
+            f.write(text)
+        # save_npz appends .npz to names that lack it
+        sparse.save_npz(counts_path + suffix + ".npz", counts, compressed=False)
+        os.replace(text_path + suffix, text_path)
+        os.replace(counts_path + suffix + ".npz", counts_path)
+
+    def prune_segments(self, live_hashes):
+        """Deletes segments for content no longer present in the corpus."""
+        if not os.path.isdir(self.segments_dir):
+            return
+        for name in os.listdir(self.segments_dir):
+            if name.split(".", 1)[0] not in live_hashes:
+                try:
+                    os.remove(os.path.join(self.segments_dir, name))
+                except OSError:
+                    pass
@@ -0,0 +1,243 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from utils.llm_transport import LLMCancelled
+
+INTERACTIVE = 0  # a user waiting in the chat
+BATCH = 1  # batch_questions.py / answer_many
+
+# Per provider: (requests per minute, tokens per minute), None for no limit.
+# Set below the account's limits, so bursts queue here instead of failing with 429.
+RATE_LIMITS = {
+    "OpenAI": (500, 160000),
+    "Perplexity": (50, None),
+    "Local": (None, None),
+}
+# Completion tokens reserved per request until the real usage is known
+EXPECTED_COMPLETION_TOKENS = 400
+POLL_SECONDS = 0.5
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, in bursts of up to `burst_seconds` worth."""
+
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # a huge request must not wait forever
+        return max(amount - self.level, 0.0) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Takes `amount` more units (gives them back if negative), e.g. once real usage is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class Ticket:
+    """One request's place in an LLMScheduler queue."""
+
+    def __init__(self, scheduler, session, tokens, priority):
+        self.scheduler = scheduler
+        self.session = session
+        self.tokens = tokens
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self.queued = False  # had to wait for others or for budget
+        self.used = None
+
+    def wait(self, cancel=None, on_position=None):
+        """Blocks until the request may be sent.
+
+        `on_position(position)` is called with the number of requests ahead
+        (0: next, waiting for rate limit budget) every time the queue is
+        checked; exceptions it raises, like setting the `cancel` event,
+        take the request out of the queue.
+        """
+        condition = self.scheduler.condition
+        try:
+            while True:
+                with condition:
+                    delay = self.scheduler._dispatch()
+                    if self.granted:
+                        return
+                    self._mark_queued()
+                    position = self.scheduler._position(self)
+                if on_position is not None:
+                    on_position(position)
+                if cancel is not None and cancel.is_set():
+                    raise LLMCancelled("cancelled")
+                with condition:
+                    if not self.granted:
+                        condition.wait(min(delay or POLL_SECONDS, POLL_SECONDS))
+        except BaseException:
+            self.cancel()
+            raise
+
+    async def wait_async(self):
+        """wait() for asyncio code: polls instead of blocking the event loop."""
+        try:
+            while True:
+                with self.scheduler.condition:
+                    delay = self.scheduler._dispatch()
+                    if self.granted:
+                        return
+                    self._mark_queued()
+                await asyncio.sleep(min(delay or POLL_SECONDS, POLL_SECONDS))
+        except BaseException:
+            self.cancel()
+            raise
+
+    def _mark_queued(self):
+        if not self.queued:
+            self.queued = True
+            self.scheduler.queued += 1
+
+    def cancel(self):
+        with self.scheduler.condition:
+            if not self.granted and not self.cancelled:
+                self.cancelled = True
+                self.scheduler._remove(self)
+                self.scheduler.condition.notify_all()
+
+    def done(self, tokens_used=None):
+        """Corrects the token bucket with the request's real usage, when known."""
+        if not self.granted or self.used is not None or tokens_used is None:
+            return
+        self.used = tokens_used
+        with self.scheduler.condition:
+            if self.scheduler.tokens is not None:
+                self.scheduler.tokens.adjust(tokens_used - self.tokens)
+
+
+class LLMScheduler:
+    """Process-wide admission control for one provider's chat completions.
+
+    Requests wait in a queue until both token buckets (requests and tokens
+    per minute) have room. Interactive requests always go before batch
+    ones; within a priority, sessions take turns, so one user's burst of
+    questions can't starve another user. The queue position is reported
+    to waiting callers instead of letting the provider reject requests.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.condition = threading.Condition()
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.queues = {INTERACTIVE: OrderedDict(), BATCH: OrderedDict()}  # priority -> session -> tickets
+        self.granted = 0
+        self.queued = 0  # requests that had to wait
+
+    def submit(self, session, tokens, priority=INTERACTIVE):
+        """Queues a request of about `tokens` tokens; call wait() on the returned Ticket."""
+        ticket = Ticket(self, session, tokens, priority)
+        with self.condition:
+            self.queues[priority].setdefault(session, deque()).append(ticket)
+        return ticket
+
+    def try_acquire(self, session, tokens, priority=INTERACTIVE):
+        """A granted Ticket if nobody is waiting and the budget is available now, else None."""
+        with self.condition:
+            if any(self.queues.values()) or self._wait_time(tokens) > 0:
+                return None
+            self._take(tokens)
+            ticket = Ticket(self, session, tokens, priority)
+            ticket.granted = True
+            return ticket
+
+    def _wait_time(self, tokens):
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def _take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        self.granted += 1
+
+    def _order(self):
+        """Waiting tickets in the order they will be sent: by priority, then round-robin over sessions."""
+        order = []
+        for priority in sorted(self.queues):
+            queues = list(self.queues[priority].values())
+            for turn in range(max((len(q) for q in queues), default=0)):
+                order.extend(q[turn] for q in queues if turn < len(q))
+        return order
+
+    def _position(self, ticket):
+        order = self._order()
+        return order.index(ticket) if ticket in order else 0
+
+    def _remove(self, ticket):
+        sessions = self.queues[ticket.priority]
+        tickets = sessions.get(ticket.session)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del sessions[ticket.session]
+
+    def _dispatch(self):
+        """Grants queued requests while there is budget; returns the seconds until the next may go."""
+        while True:
+            order = self._order()
+            if not order:
+                return None
+            head = order[0]
+            wait = self._wait_time(head.tokens)
+            if wait > 0:
+                return wait
+            self._take(head.tokens)
+            head.granted = True
+            self._remove(head)
+            sessions = self.queues[head.priority]
+            if head.session in sessions:
+                sessions.move_to_end(head.session)  # the other sessions go first next time
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "waiting": len(self._order()),
+                "granted": self.granted,
+                "queued": self.queued,
+            }
+
+
+_lock = threading.Lock()
+_schedulers = {}  # provider -> LLMScheduler
+
+
+def get_scheduler(provider):
+    """The process-wide scheduler of a provider, with its RATE_LIMITS."""
+    with _lock:
+        scheduler = _schedulers.get(provider)
+        if scheduler is None:
+            scheduler = _schedulers[provider] = LLMScheduler(*RATE_LIMITS.get(provider, (None, None)))
+        return scheduler
+
+
+def scheduler_stats():
+    with _lock:
+        schedulers = dict(_schedulers)
+    return {provider: scheduler.stats() for provider, scheduler in sorted(schedulers.items())}
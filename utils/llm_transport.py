@@ -0,0 +1,338 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+import numpy as np
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, DefaultHttpxClient, OpenAI
+from utils.metrics import Metrics, log_event
+
+logger = logging.getLogger("argus.llm")
+
+# Rate limits, overloaded or failing servers and request timeouts are worth retrying;
+# anything else (bad key, bad request) fails the same way every time
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMDeadlineExceeded(Exception):
+    """The call's total latency budget ran out."""
+
+
+class LLMCancelled(Exception):
+    """The caller cancelled the call (e.g. the user left the page)."""
+
+
+class RetryPolicy:
+    """How often and how long one LLM call may be tried.
+
+    Each attempt gets at most `attempt_timeout` seconds and the whole call,
+    retries and backoff included, at most `deadline` seconds. Retries wait a
+    jittered exponential backoff (or the server's Retry-After, capped at
+    `max_delay`), so sessions throttled together don't retry in lockstep.
+    """
+
+    def __init__(self, max_attempts=4, attempt_timeout=30.0, deadline=90.0, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class TransportStats:
+    """Process-wide call, retry and latency counts of the LLM transport."""
+
+    def __init__(self, window=500):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.cancelled = 0  # stopped by the caller, e.g. the losing leg of a hedged call
+        self.latencies = deque(maxlen=window)  # seconds of the most recent successful calls
+
+    def record(self, attempts, seconds, outcome):
+        """Counts one call; `outcome` is "ok", "failed" or "cancelled"."""
+        with self.lock:
+            self.calls += 1
+            self.attempts += attempts
+            self.retries += max(attempts - 1, 0)
+            if outcome == "ok":
+                self.latencies.append(seconds)
+            elif outcome == "cancelled":
+                self.cancelled += 1
+            else:
+                self.failures += 1
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "failures": self.failures,
+                "cancelled": self.cancelled,
+                "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+                "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+            }
+
+
+class LatencyHistogram:
+    """Counts of latencies in log-spaced buckets (10 ms to 2 min); constant memory, cheap quantiles."""
+
+    BOUNDS = np.geomspace(0.01, 120.0, 41)  # bucket upper bounds in seconds, ~26% apart
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = np.zeros(len(self.BOUNDS) + 1, dtype=np.int64)  # last bucket: slower than 2 min
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[np.searchsorted(self.BOUNDS, seconds)] += 1
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-quantile, or None without samples."""
+        with self.lock:
+            total = self.counts.sum()
+            if not total:
+                return None
+            bucket = int(np.searchsorted(np.cumsum(self.counts), q * total))
+        return float(self.BOUNDS[min(bucket, len(self.BOUNDS) - 1)])
+
+
+stats = TransportStats()
+
+_lock = threading.Lock()
+_histograms = {}  # (provider, kind) -> LatencyHistogram
+_http_client = None
+_clients = {}  # (api_key, base_url) -> OpenAI
+
+
+def get_client(api_key, base_url=None):
+    """The process-wide OpenAI client for a key and endpoint.
+
+    All clients share one HTTP connection pool, so sessions reuse warm
+    keep-alive connections instead of doing a TCP and TLS handshake per
+    engine. The SDK's own retries are off: LLMTransport retries.
+    """
+    global _http_client
+    with _lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            if _http_client is None:
+                _http_client = DefaultHttpxClient()
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=_http_client)
+            _clients[(api_key, base_url)] = client
+        return client
+
+
+def latency_histogram(provider, kind):
+    """The process-wide histogram of a provider's "first_token" (streamed) or "response" latencies."""
+    with _lock:
+        return _histograms.setdefault((provider, kind), LatencyHistogram())
+
+
+def latency_report():
+    """p50/p95 (ms) and sample count of every latency histogram, for display."""
+    with _lock:
+        histograms = dict(_histograms)
+    report = {}
+    for (provider, kind), histogram in sorted(histograms.items()):
+        if histogram.total:
+            report[f"{provider} {kind}"] = {
+                "samples": histogram.total,
+                "p50_ms": round(histogram.quantile(0.5) * 1000),
+                "p95_ms": round(histogram.quantile(0.95) * 1000),
+            }
+    return report
+
+
+def retry_reason(error):
+    """Short name of why `error` is worth retrying, or None if it is not."""
+    if isinstance(error, (APITimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection"
+    if isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS:
+        return "rate_limited" if error.status_code == 429 else "server_error"
+    return None
+
+
+def retry_after(error):
+    """Seconds the server asked to wait (Retry-After / retry-after-ms headers), or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+class _Budget:
+    """Attempt counting and deadline bookkeeping for one call."""
+
+    def __init__(self, policy, metrics, cancel, deadline):
+        self.policy = policy
+        self.metrics = metrics
+        self.cancel = cancel
+        self.seconds = deadline if deadline is not None else policy.deadline
+        self.started = time.monotonic()
+        self.deadline = self.started + self.seconds
+        self.attempts = 0
+        self.closed = False  # a stream the caller closed
+
+    def check(self):
+        if self.cancelled:
+            raise LLMCancelled("cancelled")
+        if time.monotonic() >= self.deadline:
+            raise LLMDeadlineExceeded(f"no answer within {self.seconds:g}s")
+
+    def next_attempt(self):
+        """Timeout for the next attempt: the attempt budget, or what is left of the deadline."""
+        self.check()
+        self.attempts += 1
+        self.metrics.count("llm_attempts")
+        return min(self.policy.attempt_timeout, self.deadline - time.monotonic())
+
+    def backoff(self, error):
+        """Delay before retrying after `error`; raises if it must not (or cannot) be retried."""
+        reason = retry_reason(error)
+        if reason is None or self.attempts >= self.policy.max_attempts:
+            raise error
+        delay = self.policy.backoff(self.attempts - 1, retry_after(error))
+        if time.monotonic() + delay >= self.deadline:
+            raise LLMDeadlineExceeded(f"no answer within {self.seconds:g}s") from error
+        self.metrics.count("llm_retries")
+        self.metrics.count(f"llm_retries_{reason}")
+        log_event(logger, "llm_retry", logging.WARNING, attempt=self.attempts, reason=reason,
+                  delay_s=round(delay, 3), error=str(error))
+        return delay
+
+    @property
+    def cancelled(self):
+        return self.closed or (self.cancel is not None and self.cancel.is_set())
+
+    def finish(self, ok):
+        # A call the caller cancelled is neither a failure nor a latency sample,
+        # even if its response arrived after the cancel
+        outcome = "cancelled" if self.cancelled else "ok" if ok else "failed"
+        stats.record(self.attempts, time.monotonic() - self.started, outcome)
+
+
+class LLMTransport:
+    """Chat completions over the shared connection pool, with retries and latency budgets.
+
+    Latency, attempts and retries of every call go to the `metrics` passed
+    in and to the process-wide `stats`; successful calls also feed the
+    provider's latency histograms (see latency_histogram) under `name`. A `cancel` threading.Event stops a
+    call between attempts, during backoff and between streamed tokens;
+    closing a stream_chat generator (as Streamlit does when the user leaves
+    the page mid-answer) closes the HTTP response right away.
+    """
+
+    def __init__(self, api_key, base_url=None, policy=None, name=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.name = name or base_url or "OpenAI"
+        self.client = get_client(api_key, base_url)
+        self.policy = policy or RetryPolicy()
+
+    def _wait(self, budget, delay):
+        with budget.metrics.span("llm_backoff"):
+            if budget.cancel is not None:
+                if budget.cancel.wait(delay):
+                    raise LLMCancelled("cancelled")
+            else:
+                time.sleep(delay)
+
+    def _create(self, budget, **params):
+        while True:
+            timeout = budget.next_attempt()
+            try:
+                return self.client.chat.completions.create(timeout=timeout, **params)
+            except Exception as e:
+                self._wait(budget, budget.backoff(e))
+
+    def chat(self, messages, model, metrics=None, cancel=None, deadline=None, **params):
+        """Returns the chat completion response; `deadline` overrides the policy's."""
+        budget = _Budget(self.policy, metrics or Metrics("llm"), cancel, deadline)
+        ok = False
+        try:
+            response = self._create(budget, model=model, messages=messages, **params)
+            ok = True
+            if not budget.cancelled:
+                # A cancelled hedge leg already had its latency recorded when it lost
+                latency_histogram(self.name, "response").observe(time.monotonic() - budget.started)
+            return response
+        finally:
+            budget.finish(ok)
+
+    def stream_chat(self, messages, model, metrics=None, cancel=None, deadline=None, **params):
+        """Yields the answer's text deltas.
+
+        Only opening the stream is retried: once tokens have been yielded a
+        failure is raised, since the caller has already shown them.
+        """
+        budget = _Budget(self.policy, metrics or Metrics("llm"), cancel, deadline)
+        ok = False
+        stream = None
+        try:
+            stream = self._create(budget, model=model, messages=messages, stream=True, **params)
+            first = True
+            for event in stream:
+                budget.check()
+                if event.choices and event.choices[0].delta.content:
+                    if first:
+                        latency_histogram(self.name, "first_token").observe(time.monotonic() - budget.started)
+                        first = False
+                    yield event.choices[0].delta.content
+            ok = True
+        except GeneratorExit:
+            budget.closed = True
+            raise
+        finally:
+            if stream is not None:
+                stream.close()
+            budget.finish(ok)
+
+    def async_client(self):
+        """A new AsyncOpenAI client for one event loop (async pools can't be shared across loops)."""
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    async def chat_async(self, client, messages, model, metrics=None, deadline=None, **params):
+        """Async chat() on a client from async_client()."""
+        budget = _Budget(self.policy, metrics or Metrics("llm"), None, deadline)
+        ok = False
+        try:
+            while True:
+                timeout = budget.next_attempt()
+                try:
+                    response = await asyncio.wait_for(
+                        client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params),
+                        timeout
+                    )
+                    ok = True
+                    latency_histogram(self.name, "response").observe(time.monotonic() - budget.started)
+                    return response
+                except Exception as e:
+                    delay = budget.backoff(e)
+                with budget.metrics.span("llm_backoff"):
+                    await asyncio.sleep(delay)
+        finally:
+            budget.finish(ok)
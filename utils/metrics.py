@@ -0,0 +1,79 @@
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("argus.metrics")
+
+# Callables receiving every finished Metrics report (a plain dict), e.g. to
+# forward timings to a monitoring system. Registered process-wide.
+_hooks = []
+
+
+def add_metrics_hook(hook):
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def remove_metrics_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def log_event(log, event, level=logging.INFO, **fields):
+    """Writes one structured log line: the event name followed by its fields as JSON."""
+    log.log(level, "%s %s", event, json.dumps(fields, default=str), extra={"event": event, "fields": fields})
+
+
+class Metrics:
+    """Named timing spans and counters for one operation, e.g. one index build or one question.
+
+    Spans with the same name accumulate, so a span inside a loop reports the
+    total time of all iterations. `finish()` logs the report and passes it to
+    the registered hooks.
+    """
+
+    def __init__(self, operation, **context):
+        self.operation = operation
+        self.context = context
+        self.spans = {}  # name -> seconds
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.total = None
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        return {
+            "operation": self.operation,
+            **self.context,
+            "total_ms": round(total * 1000, 2),
+            "spans_ms": {name: round(seconds * 1000, 2) for name, seconds in self.spans.items()},
+            "counters": dict(self.counters),
+        }
+
+    def finish(self):
+        """Stops the clock, logs the report and hands it to the hooks. Returns the report."""
+        if self.total is None:
+            self.total = time.perf_counter() - self.started
+        report = self.report()
+        log_event(logger, self.operation, **{key: value for key, value in report.items() if key != "operation"})
+        for hook in list(_hooks):
+            try:
+                hook(report)
+            except Exception:
+                logger.exception("Metrics hook %r failed", hook)
+        return report
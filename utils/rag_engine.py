@@ -1,139 +1,362 @@
 import os
+import time
+import asyncio
 import numpy as np
-from openai import OpenAI
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from pypdf import PdfReader
+from utils.answer_cache import filters_key, make_key
+from utils.facets import detect_facets
+from utils.context_packing import context_budget, estimate_tokens, pack_context
+from utils.hedging import hedged_chat, hedged_stream
+from utils.llm_scheduler import BATCH, EXPECTED_COMPLETION_TOKENS, INTERACTIVE, get_scheduler
+from utils.llm_transport import LLMDeadlineExceeded, LLMTransport
+from utils.metrics import Metrics
+from utils.rag_index import DocumentIndex
+
+
+def provider_settings(provider):
+    """(base_url, model_name) of an LLM provider."""
+    if provider == "Perplexity":
+        return "https://api.perplexity.ai", "sonar-pro"
+    if provider == "Local":
+        # Stand-in server from local_llm_server.py, for offline benchmarks and tests
+        return os.environ.get("LOCAL_LLM_URL", "http://127.0.0.1:8765/v1"), "local-echo"
+    return None, "gpt-3.5-turbo"
+
+
+class HedgeTickets:
+    """Rate limiter tickets of a hedged call: the primary provider's, and the backup's once it is sent.
+
+    The token usage of the answer is reported to the provider that gave it;
+    the other provider keeps its reservation, since its request was sent too.
+    """
+
+    def __init__(self, ticket, backup_scheduler, session, tokens):
+        self.tickets = [ticket, None]
+        self.backup_scheduler = backup_scheduler
+        self.session = session
+        self.tokens = tokens
+        self.winner = 0
+
+    def admit_backup(self):
+        # A hedge is optional load: only sent when the backup provider has budget to spare
+        self.tickets[1] = self.backup_scheduler.try_acquire(self.session, self.tokens)
+        return self.tickets[1] is not None
+
+    def pick(self, i):
+        self.winner = i
+
+    def done(self, tokens_used=None):
+        self.tickets[self.winner].done(tokens_used)
+
 
 class RAGEngine:
-    def __init__(self, transcripts_dir, api_key, provider="OpenAI"):
+    def __init__(self, transcripts_dir, api_key, provider="OpenAI", index=None, answer_cache=None,
+                 semantic_cache=None, context_tokens=None, auto_facets=False, retry_policy=None,
+                 hedge_provider=None, hedge_api_key=None, hedge_policy=None, session_id=None, **index_options):
         self.transcripts_dir = transcripts_dir
         self.api_key = api_key
         self.provider = provider
         
         # Configure Client
-        if provider == "Perplexity":
-            self.client = OpenAI(
-                api_key=api_key, 
-                base_url="https://api.perplexity.ai"
-            )
-            self.model_name = "sonar-pro"
-        else:
-            self.client = OpenAI(api_key=api_key)
-            self.model_name = "gpt-3.5-turbo"
-
-        self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.tfidf_matrix = None
-        self.chunks = []
-        
-    def process_documents(self):
-        """Loads documents (txt, pdf), splits them, and creates a TF-IDF index."""
-        if not os.path.exists(self.transcripts_dir):
-            return "Documents directory not found."
+        self.base_url, self.model_name = provider_settings(provider)
+        # Pooled, process-wide client with retries and latency budgets (utils.llm_transport.RetryPolicy)
+        self.transport = LLMTransport(api_key, self.base_url, retry_policy, name=provider)
+        self.client = self.transport.client
 
-        all_text = []
-        for root, dirs, files in os.walk(self.transcripts_dir):
-            for filename in files:
-                filepath = os.path.join(root, filename)
-                try:
-                    text = ""
-                    if filename.lower().endswith(".txt"):
-                        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                            text = f.read()
-                            # Basic cleanup for common scraping artifacts (like the ones from Cloudflare)
-                            if "<html" in text.lower() and "401 authorization required" in text.lower():
-                                print(f"Skipping blocked file: {filename}")
-                                text = ""  # Skip this file content
-                            elif "<!doctype html>" in text.lower() or "<html" in text.lower():
-                                # Very rough heuristic: if it looks like raw HTML and not a transcript summary
-                                # we might want to strip tags or just skip if it's junk.
-                                # For now, let's just warn and maybe try to start after the <body> tag if simple
-                                # or better, just rely on our manually created clean summaries
-                                # But specifically for the error user saw:
-                                if "challenge-platform" in text or "401 Authorization Required" in text:
-                                     text = ""
-                    elif filename.lower().endswith(".pdf"):
-                        reader = PdfReader(filepath)
-                        for page in reader.pages:
-                            text += page.extract_text() + "\n"
-                    
-                    if text:
-                        all_text.append({"filename": filename, "text": text})
-                except Exception as e:
-                    print(f"Skipping {filename}: {e}")
-
-        if not all_text:
-            return "No documents found in the directory."
-
-        # Chunking Strategy
-        self.chunks = []
-        chunk_size = 1000  # characters
-        overlap = 100
-
-        raw_chunks = []
-        for doc in all_text:
-            text = doc["text"]
-            for i in range(0, len(text), chunk_size - overlap):
-                chunk_text = text[i:i + chunk_size]
-                self.chunks.append(f"Source: {doc['filename']}\n\n{chunk_text}")
-                raw_chunks.append(chunk_text)
-
-        if not self.chunks:
-            return "Documents were empty."
-
-        # TF-IDF Vectorization
-        try:
-            self.tfidf_matrix = self.vectorizer.fit_transform(raw_chunks)
-            return f"Successfully processed {len(all_text)} documents into {len(self.chunks)} chunks."
-        except Exception as e:
-            return f"Error creating index: {str(e)}"
+        # Hedged mode: a second provider gets the same prompt when the first is slow
+        # to answer, and the faster of the two is used (see utils.hedging.HedgePolicy)
+        self.hedge = None
+        self.hedge_provider = hedge_provider
+        self.hedge_policy = hedge_policy
+        if hedge_provider:
+            hedge_base_url, hedge_model = provider_settings(hedge_provider)
+            self.hedge = (LLMTransport(hedge_api_key, hedge_base_url, retry_policy, name=hedge_provider), hedge_model)
+        # Answers are cached per provider; a hedged answer may come from either one
+        self.cache_provider = f"{provider}+{hedge_provider}" if hedge_provider else provider
+        # Requests wait their turn in the provider's process-wide rate limiter; sessions
+        # take turns there, so each user's session (or batch job) needs its own id
+        self.scheduler = get_scheduler(provider)
+        self.session_id = session_id or f"engine-{id(self)}"
 
-    def answer_question(self, query):
-        """Answers a question based on the processed documents."""
-        if self.tfidf_matrix is None:
-            return "Please process the documents first."
-        
-        try:
-            # Transform query
-            query_vec = self.vectorizer.transform([query])
-            
-            # Compute Similarities
-            similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-            
-            # Get Top K indices
-            k = 5
-            related_docs_indices = similarities.argsort()[:-k-1:-1]
-            
-            # Retrieve context
-            context_chunks = [self.chunks[i] for i in related_docs_indices]
-            context = "\n\n---\n\n".join(context_chunks)
+        # The retrieval index has nothing to do with the LLM client: pass a shared,
+        # already processed DocumentIndex to make this engine a thin per-session handle
+        self.index = index if index is not None else DocumentIndex(transcripts_dir, **index_options)
+        # Optional AnswerCache, usually shared by every session in the process
+        self.answer_cache = answer_cache
+        # Optional SemanticAnswerCache for paraphrases of earlier questions
+        self.semantic_cache = semantic_cache
+        # Retrieved context is packed into this many prompt tokens (default: per model)
+        self.context_tokens = context_tokens or context_budget(self.model_name)
+        self.candidate_pool = 20
+        # Infer company/year/quarter/doc type filters from the question when none are given
+        self.auto_facets = auto_facets
+        # Report of the most recent question's timing spans and counters (see utils.metrics)
+        self.last_metrics = None
+
+    def process_documents(self):
+        """Loads documents (txt, pdf), splits them, and creates a TF-IDF index."""
+        return self.index.process_documents()
 
-            # Generate Answer
-            if self.provider == "Perplexity":
-                system_prompt = """You are a strategic financial analyst assistant. 
+    def _system_prompt(self):
+        if self.provider == "Perplexity":
+            return """You are a strategic financial analyst assistant. 
                 Your goal is to answer the user's question.
                 Use the provided context from earnings call transcripts, reports, and presentations as your primary source.
                 However, if the answer is not in the context, you MAY use your internal knowledge search to answer strategic questions about the company's history.
                 Focus on strategic initiatives, supply chain choices, operational impacts, and forward-looking statements.
                 Reference the source company/file when possible."""
-            else:
-                system_prompt = """You are a strategic financial analyst assistant. 
+        return """You are a strategic financial analyst assistant. 
                 Your goal is to answer the user's question based ONLY on the provided context from earnings call transcripts, reports, and presentations.
                 Focus on strategic initiatives, supply chain choices, operational impacts, and forward-looking statements.
                 If the answer is not in the context, say so.
                 Reference the source company/file when possible."""
 
-            messages = [
-                {"role": "system", "content": system_prompt},
+    def _metrics(self, operation):
+        return Metrics(operation, provider=self.cache_provider, model=self.model_name, retriever=self.index.retriever_name)
+
+    def _prepare(self, query, filters=None, metrics=None):
+        """Runs the answer caches and retrieval for a query.
+
+        Returns (cached_answer, None) on a cache hit, otherwise (None, request)
+        where request holds the chat messages and what is needed to cache the answer.
+        Stage timings and counters go to `metrics` when given.
+        """
+        if metrics is None:
+            metrics = Metrics("prepare")
+
+        detected = False
+        if not filters and self.auto_facets:
+            with metrics.span("detect_facets"):
+                filters = detect_facets(query)
+            detected = bool(filters)
+
+        request = {"cache_key": None, "query_vec": None, "chunk_ids": [], "scope": None}
+        if self.answer_cache is not None:
+            with metrics.span("answer_cache"):
+                request["cache_key"] = make_key(query, self.cache_provider, self.model_name, self.index.index_key, filters)
+                cached = self.answer_cache.get(request["cache_key"])
+            if cached is not None:
+                metrics.count("answer_cache_hits")
+                return cached, None
+
+        # Get a candidate pool from the selected retrieval backend, then keep a
+        # diverse, de-duplicated subset that fits the model's context budget
+        with metrics.span("search"):
+            hits = self.index.search(query, self.candidate_pool, filters)
+            if not hits and detected:
+                # Guessed filters matched nothing useful: fall back to the whole corpus
+                hits = self.index.search(query, self.candidate_pool)
+        metrics.count("candidates", len(hits))
+        with metrics.span("pack_context"):
+            spans, request["chunk_ids"] = pack_context(
+                self.index.chunks, self.index.tfidf_matrix, hits, self.context_tokens
+            )
+        metrics.count("context_chunks", len(request["chunk_ids"]))
+        metrics.count("context_spans", len(spans))
+
+        if self.semantic_cache is not None:
+            with metrics.span("semantic_cache"):
+                request["scope"] = (self.cache_provider, self.model_name, self.index.index_key, filters_key(filters))
+                request["query_vec"] = self.index.vectorizer.transform([query])
+                cached = self.semantic_cache.get(request["query_vec"], request["chunk_ids"], request["scope"])
+            if cached is not None:
+                metrics.count("semantic_cache_hits")
+                return cached, None
+
+        # Retrieve context (strings are only built for the packed spans)
+        with metrics.span("build_prompt"):
+            context_chunks = [self.index.chunks.format_span(*span) for span in spans]
+            context = "\n\n---\n\n".join(context_chunks)
+
+            request["messages"] = [
+                {"role": "system", "content": self._system_prompt()},
                 {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"}
             ]
+        metrics.count("context_chars", len(context))
+        request["prompt_tokens"] = estimate_tokens(sum(len(m["content"]) for m in request["messages"]))
+        metrics.count("prompt_tokens_est", request["prompt_tokens"])
+        return None, request
 
-            chat_response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=0.3
-            )
+    def _remember(self, request, answer):
+        # Only real answers are cached, errors must be retried next time
+        if not answer:
+            return
+        if request["cache_key"] is not None:
+            self.answer_cache.put(request["cache_key"], answer)
+        if request["query_vec"] is not None:
+            self.semantic_cache.put(request["query_vec"], request["chunk_ids"], request["scope"], answer)
+
+    @staticmethod
+    def _count_usage(metrics, response):
+        """Counts the response's token usage; returns the total, or None if not reported."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return None
+        metrics.count("prompt_tokens", usage.prompt_tokens or 0)
+        metrics.count("completion_tokens", usage.completion_tokens or 0)
+        return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+    def _admit(self, request, metrics, priority=INTERACTIVE, cancel=None, on_queue=None):
+        """Waits for the request's turn in the provider's rate limiter; returns its Ticket."""
+        ticket = self.scheduler.submit(self.session_id, request["prompt_tokens"] + EXPECTED_COMPLETION_TOKENS, priority)
+        with metrics.span("rate_limit_wait"):
+            ticket.wait(cancel, on_queue)
+        if ticket.queued:
+            metrics.count("rate_limit_queued")
+        return ticket
+
+    def _tickets(self, request, ticket):
+        """The request's rate limiter tickets: `ticket` alone, or HedgeTickets for a hedged call."""
+        if self.hedge is None:
+            return ticket
+        return HedgeTickets(ticket, get_scheduler(self.hedge_provider), self.session_id,
+                            request["prompt_tokens"] + EXPECTED_COMPLETION_TOKENS)
+
+    def _chat(self, request, metrics, tickets):
+        if self.hedge is not None:
+            return hedged_chat((self.transport, self.model_name), self.hedge, request["messages"], metrics,
+                               self.hedge_policy, admit_backup=tickets.admit_backup, on_pick=tickets.pick,
+                               temperature=0.3)
+        return self.transport.chat(request["messages"], self.model_name, metrics, temperature=0.3)
+
+    def _stream(self, request, metrics, cancel, tickets):
+        if self.hedge is not None:
+            return hedged_stream((self.transport, self.model_name), self.hedge, request["messages"], metrics,
+                                 self.hedge_policy, cancel, admit_backup=tickets.admit_backup, on_pick=tickets.pick,
+                                 temperature=0.3)
+        return self.transport.stream_chat(request["messages"], self.model_name, metrics, cancel, temperature=0.3)
+
+    def answer_question(self, query, filters=None):
+        """Answers a question based on the processed documents.
+
+        `filters` optionally restricts retrieval by facet, see DocumentIndex.search.
+        Per-stage timings of the call are kept in `last_metrics`.
+        """
+        if not self.index.is_ready:
+            return "Please process the documents first."
+
+        metrics = self._metrics("answer_question")
+        try:
+            cached, request = self._prepare(query, filters, metrics)
+            if cached is not None:
+                return cached
+
+            tickets = self._tickets(request, self._admit(request, metrics))
+            with metrics.span("llm"):
+                chat_response = self._chat(request, metrics, tickets)
+            tickets.done(self._count_usage(metrics, chat_response))
+
+            answer = chat_response.choices[0].message.content
+        except Exception as e:
+            metrics.count("errors")
+            return f"Error answering question: {str(e)}"
+        finally:
+            self.last_metrics = metrics.finish()
+
+        self._remember(request, answer)
+        return answer
+
+    def answer_question_stream(self, query, filters=None, cancel=None, on_queue=None):
+        """Like answer_question, but yields the answer in text deltas as the LLM generates it.
+
+        The full answer is cached once the stream completes. Closing the
+        generator, or setting the `cancel` threading.Event, aborts the LLM
+        request. While the request waits for the provider's rate limit,
+        `on_queue(position)` is called with the number of requests ahead of
+        it, and `on_queue(None)` once it is sent.
+        """
+        if not self.index.is_ready:
+            yield "Please process the documents first."
+            return
+
+        metrics = self._metrics("answer_question_stream")
+        parts = []
+        try:
+            cached, request = self._prepare(query, filters, metrics)
+            if cached is not None:
+                yield cached
+                return
+
+            tickets = self._tickets(request, self._admit(request, metrics, INTERACTIVE, cancel, on_queue))
+            if on_queue is not None:
+                on_queue(None)
+            with metrics.span("llm"):
+                deltas = self._stream(request, metrics, cancel, tickets)
+                started = time.perf_counter()
+                try:
+                    for delta in deltas:
+                        if not parts:
+                            metrics.add_time("llm_first_token", time.perf_counter() - started)
+                        parts.append(delta)
+                        yield delta
+                except GeneratorExit:
+                    metrics.count("cancelled")
+                    raise
+                finally:
+                    deltas.close()
+                    completion_tokens = estimate_tokens(sum(len(part) for part in parts))
+                    tickets.done(request["prompt_tokens"] + completion_tokens)
+            metrics.count("completion_tokens_est", completion_tokens)
+        except Exception as e:
+            metrics.count("errors")
+            yield f"Error answering question: {str(e)}"
+            return
+        finally:
+            self.last_metrics = metrics.finish()
+
+        self._remember(request, "".join(parts))
 
-            return chat_response.choices[0].message.content
+    async def _answer_async(self, client, query, semaphore, timeout, filters):
+        metrics = self._metrics("answer_many")
+        try:
+            cached, request = self._prepare(query, filters, metrics)
+            if cached is not None:
+                return cached
+            # Wait for the rate limiter before taking a concurrency slot
+            ticket = self.scheduler.submit(self.session_id, request["prompt_tokens"] + EXPECTED_COMPLETION_TOKENS, BATCH)
+            with metrics.span("rate_limit_wait"):
+                await ticket.wait_async()
+            if ticket.queued:
+                metrics.count("rate_limit_queued")
+            with metrics.span("queue_wait"):
+                await semaphore.acquire()
+            try:
+                with metrics.span("llm"):
+                    chat_response = await self.transport.chat_async(
+                        client, request["messages"], self.model_name, metrics, deadline=timeout, temperature=0.3
+                    )
+            finally:
+                semaphore.release()
+            ticket.done(self._count_usage(metrics, chat_response))
+            answer = chat_response.choices[0].message.content
+        except LLMDeadlineExceeded:
+            metrics.count("timeouts")
+            return f"Error answering question: timed out after {timeout}s"
         except Exception as e:
+            metrics.count("errors")
             return f"Error answering question: {str(e)}"
+        finally:
+            self.last_metrics = metrics.finish()
+
+        self._remember(request, answer)
+        return answer
+
+    async def _answer_many(self, queries, max_concurrency, timeout, filters):
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async with self.transport.async_client() as client:
+            return await asyncio.gather(
+                *(self._answer_async(client, query, semaphore, timeout, filters) for query in queries)
+            )
+
+    def answer_many(self, queries, max_concurrency=5, timeout=120, filters=None):
+        """Answers a batch of questions concurrently with the async client.
+
+        At most `max_concurrency` LLM requests are in flight at once and each one
+        (retries included) is abandoned after `timeout` seconds. `filters` applies to every
+        question. Answers (or error strings) are returned in the same order as
+        `queries`. Batches are not hedged: they are throughput bound, and a
+        second request per question would only add load. They go through the
+        provider's rate limiter at batch priority, behind interactive chat.
+        """
+        if not self.index.is_ready:
+            return ["Please process the documents first."] * len(queries)
+        return asyncio.run(self._answer_many(list(queries), max_concurrency, timeout, filters))
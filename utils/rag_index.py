@@ -0,0 +1,271 @@
+import os
+import logging
+import numpy as np
+from scipy import sparse
+from utils.chunk_store import ChunkStore, document_chunk_offsets
+from utils.dedup import dedup_documents
+from utils.facets import FacetIndex, document_facets
+from utils.doc_extract import DEFAULT_EXTRACT_TIMEOUT, extract_documents
+from utils.index_cache import IndexCache, build_manifest, diff_manifests, manifest_key
+from utils.metrics import Metrics
+from utils.spreadsheet import SHEET_FORMAT_VERSION, SPREADSHEET_EXTENSIONS, is_spreadsheet
+from utils.retrieval import BM25Retriever, build_retriever
+from utils.tfidf import HashingTfidfVectorizer
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf") + SPREADSHEET_EXTENSIONS
+
+logger = logging.getLogger("argus.index")
+
+class DocumentIndex:
+    """Retrieval index over a documents folder.
+
+    Holds no LLM state, so a single instance can be shared by every session
+    and provider; it is identified by its corpus key (see `corpus_key`).
+    """
+
+    def __init__(self, transcripts_dir, cache_dir=None, extract_workers=None,
+                 extract_timeout=DEFAULT_EXTRACT_TIMEOUT, retriever="tfidf", mmap=True, extra_dirs=None,
+                 dedup=True, compact=True):
+        self.transcripts_dir = transcripts_dir
+        # Other folders indexed alongside, e.g. transcripts/ next to documents/.
+        # Paths in the manifest are relative to the parent of transcripts_dir.
+        self.base_dir = os.path.dirname(os.path.abspath(transcripts_dir))
+        self.source_dirs = [transcripts_dir] + [d for d in (extra_dirs or []) if os.path.isdir(d)]
+        self.facets = None
+        # Compact mode stores weights, idf and postings as float32 (indices are
+        # int32 either way): half the index size, same ranking
+        self.compact = compact
+        self.vectorizer = HashingTfidfVectorizer(dtype=np.float32 if compact else np.float64)
+        self.tfidf_matrix = None
+        self.chunks = ChunkStore.empty()
+        # "tfidf" (cosine over the TF-IDF matrix) or "bm25" (inverted index)
+        self.retriever_name = retriever
+        self.retriever = None
+        self.chunk_size = 1000  # characters
+        self.overlap = 100
+        # Index near-duplicate documents and repeated boilerplate passages once (see utils.dedup)
+        self.dedup = dedup
+        # PDF parsing runs on a process pool; None picks a worker count from the CPU count
+        self.extract_workers = extract_workers
+        self.extract_timeout = extract_timeout
+
+        # Fitted indexes are cached next to the documents folder unless told otherwise
+        if cache_dir is None:
+            cache_dir = os.path.join(self.base_dir, ".rag_cache")
+        self.cache = IndexCache(cache_dir)
+        self.index_key = None
+        # Serve the index from memory-mapped cache files shared with other sessions/processes
+        self.mmap = mmap
+        # Report of the last process_documents() timing spans and counters (see utils.metrics)
+        self.last_metrics = None
+
+    def _use_index(self, index):
+        self.chunks = index["chunks"]
+        self.facets = FacetIndex(index["facets"], self.chunks.doc_ids)
+        self.vectorizer.idf_ = index["idf"]
+        self.tfidf_matrix = index["tfidf"]
+        self.retriever = build_retriever(
+            self.retriever_name, self.vectorizer, self.tfidf_matrix, index["postings"], index["chunk_lengths"]
+        )
+
+    @property
+    def is_ready(self):
+        return self.retriever is not None
+
+    def _params(self):
+        return {
+            "chunk_size": self.chunk_size, "overlap": self.overlap, "dedup": self.dedup, "compact": self.compact,
+            "sheet_format": SHEET_FORMAT_VERSION,
+        }
+
+    def corpus_key(self):
+        """Key of the documents folder as it is on disk now; cheap when hashes can be reused."""
+        manifest = self._manifest(self.cache.latest_manifest())
+        return manifest_key(manifest, self._params())
+
+    def is_cached(self):
+        """Whether process_documents() would load the current folder straight from the cache."""
+        return self.cache.has(self.corpus_key())
+
+    def _manifest(self, previous):
+        return build_manifest(self.source_dirs, SUPPORTED_EXTENSIONS, self.base_dir, previous=previous)
+
+    def search(self, query, k=5, filters=None):
+        """Returns [(chunk_index, score), ...] for the k best chunks.
+
+        `filters` ({facet: value or [values]}, see utils.facets) restricts the
+        search to matching chunks, e.g. {"company": "KMB", "year": 2025, "doc_type": "transcript"}.
+        """
+        allowed = self.facets.select(filters)
+        if allowed is not None and len(allowed) == 0:
+            return []
+        return self.retriever.search(query, k, allowed)
+
+    def _split_text(self, filename, text):
+        starts, ends = document_chunk_offsets(filename, text, self.chunk_size, self.overlap)
+        return [text[start:end] for start, end in zip(starts, ends)]
+
+    @staticmethod
+    def _segment_key(entry):
+        """Segment cache key of a file: its content hash, plus the text layout version for workbooks."""
+        if is_spreadsheet(entry["path"]):
+            return f"{entry['sha1']}-s{SHEET_FORMAT_VERSION}"
+        return entry["sha1"]
+
+    def process_documents(self, progress=None):
+        """Loads documents (txt, pdf, xlsx), splits them, and creates a TF-IDF index.
+
+        The fitted index is cached on disk keyed by the corpus manifest, so an
+        unchanged documents folder is loaded without re-parsing any file. When
+        the folder changed, only new or modified files are extracted and
+        vectorized; everything else comes from per-file cached segments.
+        Workbooks are serialized to one line per table row (see
+        utils.spreadsheet) and chunked on row boundaries.
+
+        Per-stage timings and counters are kept in `last_metrics`.
+        `progress(files_done, files_total)` is called as files are read.
+        """
+        metrics = Metrics("process_documents", retriever=self.retriever_name)
+        try:
+            status = self._process_documents(metrics, progress)
+        finally:
+            self.last_metrics = metrics.finish()
+        return status
+
+    def _process_documents(self, metrics, progress):
+        if not os.path.exists(self.transcripts_dir):
+            return "Documents directory not found."
+
+        with metrics.span("manifest"):
+            previous = self.cache.latest_manifest()
+            manifest = self._manifest(previous)
+            self.index_key = manifest_key(manifest, self._params())
+        metrics.count("files", len(manifest))
+        metrics.count("bytes", sum(entry["size"] for entry in manifest))
+
+        with metrics.span("cache_load"):
+            cached = self.cache.load(self.index_key, mmap=self.mmap)
+        if cached is not None:
+            self._use_index(cached)
+            metrics.count("chunks", len(self.chunks))
+            if progress is not None:
+                progress(len(manifest), len(manifest))
+            return f"Successfully loaded {self.chunks.num_documents} documents into {len(self.chunks)} chunks from cache."
+
+        # Reuse per-file segments; only files whose content is new get extracted
+        params_tag = f"c{self.chunk_size}o{self.overlap}"
+        filepaths = [os.path.join(self.base_dir, entry["path"]) for entry in manifest]
+        with metrics.span("segments_load"):
+            segments = [self.cache.load_segment(self._segment_key(entry), params_tag) for entry in manifest]
+        missing = [i for i, segment in enumerate(segments) if segment is None]
+        reused = len(manifest) - len(missing)
+        metrics.count("segments_reused", reused)
+
+        def extract_progress(done, _total):
+            progress(reused + done, len(manifest))
+
+        if progress is not None:
+            progress(reused, len(manifest))
+        with metrics.span("extract"):
+            texts = extract_documents(
+                [filepaths[i] for i in missing], workers=self.extract_workers, timeout=self.extract_timeout,
+                metrics=metrics, progress=extract_progress if progress is not None else None
+            )
+
+        # Don't persist an index that is missing files only because they timed out
+        complete = True
+        for i, text in zip(missing, texts):
+            if text is None:
+                complete = False
+                continue
+            with metrics.span("vectorize"):
+                chunk_texts = self._split_text(filepaths[i], text)
+                if chunk_texts:
+                    counts = self.vectorizer.counts(chunk_texts)
+                else:
+                    counts = sparse.csr_matrix((0, self.vectorizer.n_features))
+            with metrics.span("segments_save"):
+                try:
+                    self.cache.save_segment(self._segment_key(manifest[i]), params_tag, text, counts)
+                except OSError as e:
+                    logger.warning("Could not cache %s: %s", os.path.basename(filepaths[i]), e)
+            segments[i] = (text, counts)
+
+        # Assemble documents and count rows in manifest order; each text is kept once
+        filenames, doc_texts, count_blocks, doc_facets = [], [], [], []
+        for entry, filepath, segment in zip(manifest, filepaths, segments):
+            if segment is None or not segment[0]:
+                continue
+            filenames.append(os.path.basename(filepath))
+            doc_facets.append(document_facets(entry["path"]))
+            doc_texts.append(segment[0])
+            count_blocks.append(segment[1])
+
+        if self.dedup and doc_texts:
+            # Segments hold each file's full text; suppression depends on the whole
+            # corpus, so it runs per build and only cut documents are re-counted
+            with metrics.span("dedup"):
+                deduped, _, stats = dedup_documents(doc_texts)
+            for name, value in stats.items():
+                metrics.count(name, value)
+            kept = [i for i, text in enumerate(deduped) if text is not None]
+            with metrics.span("vectorize"):
+                for i in kept:
+                    if deduped[i] is not doc_texts[i]:
+                        chunk_texts = self._split_text(filenames[i], deduped[i])
+                        count_blocks[i] = (
+                            self.vectorizer.counts(chunk_texts) if chunk_texts
+                            else sparse.csr_matrix((0, self.vectorizer.n_features))
+                        )
+            filenames = [filenames[i] for i in kept]
+            doc_facets = [doc_facets[i] for i in kept]
+            doc_texts = [deduped[i] for i in kept]
+            count_blocks = [count_blocks[i] for i in kept]
+
+        if not doc_texts:
+            return "No documents found in the directory."
+        with metrics.span("chunk"):
+            chunks = ChunkStore.from_texts(filenames, doc_texts, self.chunk_size, self.overlap)
+        num_documents = chunks.num_documents
+        metrics.count("chunks", len(chunks))
+        metrics.count("corpus_bytes", len(chunks.corpus))
+        if not len(chunks):
+            return "Documents were empty."
+
+        # TF-IDF Vectorization: only the idf is refit over the whole corpus
+        try:
+            with metrics.span("fit"):
+                counts = sparse.vstack(count_blocks).tocsr()
+                tfidf_matrix = self.vectorizer.fit_transform_counts(counts)
+                postings, chunk_lengths = BM25Retriever.postings_from_counts(counts, self.vectorizer.dtype)
+        except Exception as e:
+            return f"Error creating index: {str(e)}"
+        index = {
+            "chunks": chunks,
+            "facets": doc_facets,
+            "idf": self.vectorizer.idf_,
+            "tfidf": tfidf_matrix,
+            "postings": postings,
+            "chunk_lengths": chunk_lengths,
+        }
+
+        if complete:
+            try:
+                with metrics.span("cache_save"):
+                    self.cache.save(self.index_key, manifest, chunks, doc_facets, self.vectorizer, tfidf_matrix, postings, chunk_lengths)
+                    self.cache.prune_segments({self._segment_key(entry) for entry in manifest})
+                if self.mmap:
+                    # Reopen what was just written so this process shares the mapped pages too
+                    with metrics.span("cache_load"):
+                        index = self.cache.load(self.index_key, mmap=True) or index
+            except OSError as e:
+                logger.warning("Could not write index cache: %s", e)
+        self._use_index(index)
+
+        if previous is not None and len(missing) < len(manifest):
+            added, changed, removed = diff_manifests(previous, manifest)
+            return (
+                f"Successfully updated index ({len(added)} added, {len(changed)} changed, {len(removed)} removed): "
+                f"{num_documents} documents, {len(self.chunks)} chunks."
+            )
+        return f"Successfully processed {num_documents} documents into {len(self.chunks)} chunks."
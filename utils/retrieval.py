@@ -0,0 +1,110 @@
+import numpy as np
+
+RETRIEVERS = ("tfidf", "bm25")
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first, without sorting the whole array."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    # stable tie-break on chunk position keeps results reproducible
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+class TfidfRetriever:
+    """Cosine similarity over the l2-normalized TF-IDF chunk matrix."""
+
+    name = "tfidf"
+
+    def __init__(self, vectorizer, tfidf_matrix):
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+
+    def search(self, query, k=5, allowed=None):
+        """Returns [(chunk_index, score), ...] for the k best chunks.
+
+        `allowed` (sorted chunk ids) restricts scoring to that subset of rows.
+        """
+        query_vec = self.vectorizer.transform([query])
+        matrix = self.tfidf_matrix if allowed is None else self.tfidf_matrix[allowed]
+        # rows and query are unit length, so the dot product is the cosine
+        scores = (matrix @ query_vec.T).toarray().ravel()
+        ids = top_k(scores, k)
+        chunk_ids = ids if allowed is None else allowed[ids]
+        return [(int(c), float(scores[i])) for c, i in zip(chunk_ids, ids)]
+
+
+class BM25Retriever:
+    """Okapi BM25 over an inverted index of term -> (chunk, term frequency) postings.
+
+    The postings are the columns of the chunk term-count matrix in CSC form, so a
+    query only touches the postings of its own terms. They can be memory-mapped
+    straight from the index cache.
+    """
+
+    name = "bm25"
+
+    def __init__(self, vectorizer, postings, chunk_lengths, k1=1.5, b=0.75):
+        self.vectorizer = vectorizer
+        self.k1 = k1
+        self.b = b
+        self.indptr = postings.indptr
+        self.chunk_ids = postings.indices
+        self.term_freqs = postings.data
+        self.num_chunks = postings.shape[0]
+        avg_length = chunk_lengths.mean() if self.num_chunks else 0.0
+        # per-chunk part of the BM25 denominator, precomputed once
+        self.length_norm = k1 * (1 - b + b * chunk_lengths / max(avg_length, 1e-9))
+
+    @staticmethod
+    def postings_from_counts(counts, dtype=np.float64):
+        """Returns (postings, chunk_lengths) for a CSR chunk term-count matrix.
+
+        Term counts are small integers, so float32 postings lose nothing.
+        """
+        postings = counts.tocsc().astype(dtype)
+        postings.sort_indices()
+        return postings, np.asarray(counts.sum(axis=1)).ravel()
+
+    def idf(self, df):
+        return np.log(1 + (self.num_chunks - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=5, allowed=None):
+        """Returns [(chunk_index, score), ...] for the k best chunks.
+
+        `allowed` (sorted chunk ids) drops postings outside that subset.
+        """
+        term_ids = np.unique(self.vectorizer.counts([query]).indices)
+        chunk_parts, score_parts = [], []
+        for term in term_ids:
+            start, end = self.indptr[term], self.indptr[term + 1]
+            if start == end:
+                continue
+            chunks = self.chunk_ids[start:end]
+            tf = self.term_freqs[start:end]
+            df = end - start
+            if allowed is not None:
+                positions = np.minimum(np.searchsorted(allowed, chunks), len(allowed) - 1)
+                keep = allowed[positions] == chunks
+                chunks, tf = chunks[keep], tf[keep]
+            chunk_parts.append(chunks)
+            score_parts.append(self.idf(df) * tf * (self.k1 + 1) / (tf + self.length_norm[chunks]))
+        if not chunk_parts:
+            return []
+        touched, inverse = np.unique(np.concatenate(chunk_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        return [(int(touched[i]), float(scores[i])) for i in top_k(scores, k)]
+
+
+def build_retriever(name, vectorizer, tfidf_matrix, postings, chunk_lengths):
+    if name == "bm25":
+        return BM25Retriever(vectorizer, postings, chunk_lengths)
+    if name == "tfidf":
+        return TfidfRetriever(vectorizer, tfidf_matrix)
+    raise ValueError(f"Unknown retriever '{name}', expected one of {RETRIEVERS}")
@@ -0,0 +1,233 @@
+import re
+import datetime
+import openpyxl
+
+SPREADSHEET_EXTENSIONS = (".xlsx", ".xlsm")
+# Bump when the text layout below changes, so cached segments are rebuilt
+SHEET_FORMAT_VERSION = 3
+SECTION_MAX_WORDS = 8  # a lone short label above data rows is a section heading, longer text is prose
+DECIMALS_RE = re.compile(r"\.(0+)")
+PLAIN_FORMATS = ("General", "0")
+YEAR_FORMAT_RE = re.compile(r"y+", re.IGNORECASE)
+# Navigation and legal boilerplate sheets: no figures, and they outrank real answers in retrieval
+BOILERPLATE_SHEET_RE = re.compile(r"table of contents|forward.looking statements", re.IGNORECASE)
+
+
+def is_spreadsheet(path):
+    return path.lower().endswith(SPREADSHEET_EXTENSIONS)
+
+
+def _clean(text):
+    return " ".join(str(text).split())
+
+
+def format_value(value, number_format="General"):
+    """A cell value as displayed: percentages scaled, numbers at the format's precision, no separators."""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        if YEAR_FORMAT_RE.fullmatch(number_format or ""):
+            return str(value.year)  # a period header showing only the year
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, (int, float)):
+        number_format = number_format or "General"
+        match = DECIMALS_RE.search(number_format.split(";")[0])
+        decimals = len(match.group(1)) if match else None
+        if "%" in number_format:
+            return f"{value * 100:.{decimals or 0}f}%"
+        if decimals is not None:
+            return f"{value:.{decimals}f}"
+        if float(value).is_integer():
+            return str(int(value))
+        return f"{value:.6g}"
+    return _clean(value)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_year(cell):
+    """A year in a header: figures that happen to be 1990..2100 have an accounting format."""
+    value = cell[1]
+    return _is_number(value) and float(value).is_integer() and 1990 <= value <= 2100 \
+        and (cell[2] or "General") in PLAIN_FORMATS
+
+
+def _read_rows(worksheet):
+    """(row number, [(column, value, number_format), ...]) of every row with a value."""
+    rows = []
+    for row in worksheet.iter_rows():
+        cells = []
+        row_number = None
+        for cell in row:
+            value = cell.value
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            row_number = cell.row
+            cells.append((cell.column, value, cell.number_format))
+        if cells:
+            rows.append((row_number, cells))
+    return rows
+
+
+def _is_data_row(cells):
+    """A row holding figures (header rows may hold years, but nothing else numeric)."""
+    numbers = [cell for cell in cells if _is_number(cell[1])]
+    return bool(numbers) and not all(_is_year(cell) for cell in numbers)
+
+
+def _column_labels(header_rows, columns):
+    """Label path (top header row first) for each value column; upper headers span right."""
+    labels = {column: [] for column in columns}
+    for cells in header_rows:
+        for column in columns:
+            left = [cell for cell in cells if cell[0] <= column]
+            if left:
+                labels[column].append(format_value(left[-1][1], left[-1][2]))
+    return labels
+
+
+def _format_values(values):
+    """'Group: label value, label value | Group: ...' for the (header path, text) values of one data row."""
+    groups = []  # [prefix, [items]]
+    for path, text in values:
+        prefix = " ".join(path[:-1])
+        item = f"{path[-1]} {text}" if path else text
+        if groups and groups[-1][0] == prefix:
+            groups[-1][1].append(item)
+        else:
+            groups.append([prefix, [item]])
+    return " | ".join(f"{prefix}: {', '.join(items)}" if prefix else ", ".join(items) for prefix, items in groups)
+
+
+def walk_sheet(rows):
+    """Yields the sheet's content as ("title", text), ("text", row, text) and ("data", row, path, values) items.
+
+    Title rows above the first table become the sheet heading. In a table,
+    the text rows right above the figures are its column headers (a header
+    spanning several columns applies to all of them), and lone short labels
+    are section headings (e.g. "Net Sales" above the per-segment rows). A
+    data row's `path` is its sections and its label; `values` are
+    (column header path, value, number format) for the cells right of it.
+    """
+    if not rows:
+        return
+    label_column = min(cells[0][0] for _, cells in rows)
+    is_data = [_is_data_row(cells) for _, cells in rows]
+
+    # Lone labels above the first table are the sheet's title block; a sheet
+    # without figures keeps all its text as lines
+    first_table = next((i for i, data in enumerate(is_data) if data), None)
+    title_end = 0
+    while first_table is not None and title_end < first_table and len(rows[title_end][1]) == 1 \
+            and rows[title_end][1][0][0] == label_column:
+        title_end += 1
+    yield "title", " - ".join(_clean(cells[0][1]) for _, cells in rows[:title_end])
+
+    labels = {}
+    sections = []
+    after_data = False
+    i = title_end
+    while i < len(rows):
+        if is_data[i]:
+            row_number, cells = rows[i]
+            # The row label is the text left of the first figure and of the header columns
+            value_start = min(labels) if labels else None
+            label_cells = []
+            for cell in cells:
+                if _is_number(cell[1]) or (value_start is not None and cell[0] >= value_start):
+                    break
+                label_cells.append(cell)
+            path = sections + [" ".join(_clean(cell[1]) for cell in label_cells)] if label_cells else list(sections)
+            values = [(labels.get(column) or [], value, fmt) for column, value, fmt in cells[len(label_cells):]]
+            yield "data", row_number, path, values
+            after_data = True
+            i += 1
+            continue
+
+        # A run of consecutive text rows: headers and sections if figures follow, otherwise prose
+        run_end = i
+        while run_end < len(rows) and not is_data[run_end] and (run_end == i or rows[run_end][0] == rows[run_end - 1][0] + 1):
+            run_end += 1
+        followed_by_data = (
+            run_end < len(rows) and is_data[run_end] and rows[run_end][0] == rows[run_end - 1][0] + 1
+        )
+        headers, run_sections = [], []
+        for row_number, cells in rows[i:run_end]:
+            lone_label = len(cells) == 1 and cells[0][0] == label_column
+            short = lone_label and len(_clean(cells[0][1]).split()) <= SECTION_MAX_WORDS
+            if followed_by_data and not lone_label:
+                headers.append(cells)
+            elif followed_by_data and short:
+                run_sections.append(_clean(cells[0][1]).rstrip(":"))
+            else:
+                yield "text", row_number, " | ".join(format_value(value, fmt) for _, value, fmt in cells)
+        if headers:
+            # Value columns start at the first figure or header right of the labels; text
+            # in the label column (e.g. "(In millions)") is a caption, not a column header
+            first_row = rows[run_end][1]
+            value_start = min(
+                [cell[0] for cell in first_row if _is_number(cell[1])]
+                + [cell[0] for cells in headers for cell in cells if cell[0] > label_column]
+            )
+            columns = {cell[0] for cells in headers + [first_row] for cell in cells if cell[0] >= value_start}
+            labels = _column_labels(headers, sorted(columns))
+            sections = []
+        if run_sections:
+            # Headings after figures replace as many innermost ones: "Basic" -> "Diluted"
+            if after_data:
+                sections = sections[:max(len(sections) - len(run_sections), 0)]
+            sections = sections + run_sections
+        elif not followed_by_data:
+            sections = []
+        after_data = False
+        i = run_end
+
+
+def sheet_lines(title, rows):
+    """Serializes one sheet (see walk_sheet) into lines, one per table row, each with its sheet and row number.
+
+    Every data row is written as `[sheet, row n] section > label | header:
+    column value, ...`, so a chunk starting mid-table still says what each
+    figure is.
+    """
+    lines = []
+    for item in walk_sheet(rows):
+        if item[0] == "title":
+            lines.append(f"[{title}] {item[1]}" if item[1] else f"[{title}]")
+        elif item[0] == "text":
+            lines.append(f"[{title}, row {item[1]}] {item[2]}")
+        else:
+            _, row_number, path, values = item
+            label = " > ".join(path)
+            text = _format_values([(header, format_value(value, fmt)) for header, value, fmt in values])
+            lines.append(f"[{title}, row {row_number}] {label} | {text}" if label else f"[{title}, row {row_number}] {text}")
+    return lines
+
+
+def iter_sheets(filepath):
+    """Yields (sheet title, rows) for every sheet of a workbook; rows as walk_sheet takes them.
+
+    Values are read as last computed by Excel (formulas are not evaluated).
+    """
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield _clean(worksheet.title), _read_rows(worksheet)
+    finally:
+        workbook.close()
+
+
+def read_xlsx(filepath):
+    """Returns (text, sheet count) of a workbook: every sheet but the boilerplate ones serialized by sheet_lines."""
+    blocks = []
+    sheets = 0
+    for title, rows in iter_sheets(filepath):
+        sheets += 1
+        if BOILERPLATE_SHEET_RE.search(title):
+            continue
+        lines = sheet_lines(title, rows)
+        if len(lines) > 1:
+            blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n" if blocks else "", sheets
@@ -0,0 +1,61 @@
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+N_FEATURES = 2 ** 20
+
+
+class HashingTfidfVectorizer:
+    """TF-IDF over a fixed hashed feature space.
+
+    Mirrors TfidfVectorizer(stop_words='english') (smooth idf, l2 norm), but term
+    columns never move, so per-document count rows can be computed once, cached
+    and stacked later. Only the idf vector depends on the whole corpus, and it is
+    cheap to recompute when documents are added or removed.
+
+    `dtype` is the dtype of the weighted output (and the stored idf); float32
+    halves the index size and is plenty for ranking. Weights are computed and
+    normalized in float64 either way, then cast.
+    """
+
+    def __init__(self, n_features=N_FEATURES, dtype=np.float64):
+        self.n_features = n_features
+        self.dtype = np.dtype(dtype)
+        self.hasher = HashingVectorizer(
+            stop_words='english',
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+        )
+        self.idf_ = None
+
+    def counts(self, texts):
+        """Raw term counts, one CSR row per text."""
+        counts = self.hasher.transform(texts).astype(np.float64).tocsr()
+        counts.sum_duplicates()
+        return counts
+
+    def fit_idf(self, counts):
+        n_samples = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=self.n_features)
+        self.idf_ = (np.log((1 + n_samples) / (1 + df)) + 1.0).astype(self.dtype)
+        return self
+
+    def weight(self, counts):
+        """Applies the fitted idf and l2 normalization to a count matrix.
+
+        Rows come out unit length, so cosine similarity is a plain sparse dot product.
+        """
+        # scale each stored count by its column's idf without building a diagonal matrix
+        weighted = counts.astype(np.float64)
+        weighted.data = weighted.data * self.idf_[weighted.indices]
+        weighted = normalize(weighted, norm="l2", copy=False).tocsr()
+        if weighted.dtype != self.dtype:
+            weighted = weighted.astype(self.dtype)
+        return weighted
+
+    def fit_transform_counts(self, counts):
+        return self.fit_idf(counts).weight(counts)
+
+    def transform(self, texts):
+        return self.weight(self.counts(texts))